@@ -0,0 +1,260 @@
+"""
+Runs many contracts in one process: one worker pool, one OCR process pool
+with its long-lived engines and one Odoo session for the whole batch.
+
+    python -m batch manifest.jsonl --report report.jsonl --workers 4
+
+The manifest is a JSON array or JSON Lines. Each item has a payload (or a
+payload_file) and optionally a pdf, given as a local path or an http(s)
+URL; relative paths are resolved against the manifest's directory.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from jobs import Job, JobQueue, JobStore, QueueFull
+from ocr_pool import get_pool
+from pipeline import download_signed_pdf, run_pipeline
+
+try:
+    from odoo_client import leased_client
+except Exception:  # noqa: BLE001 keep optional import
+    leased_client = None
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+
+
+@dataclass
+class BatchItem:
+    id: str
+    payload: dict
+    pdf: str | None = None  # local path or http(s) URL
+
+
+def _is_url(value: str) -> bool:
+    return value.startswith(("http://", "https://"))
+
+
+def parse_items(raw_items: list, base_dir: Path | None = None, allow_local_paths: bool = True) -> list[BatchItem]:
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"Batch has {len(raw_items)} items; the limit is {BATCH_MAX_ITEMS}")
+
+    items = []
+    for n, raw in enumerate(raw_items, 1):
+        if not isinstance(raw, dict):
+            raise ValueError(f"Item {n} is not an object")
+        payload = raw.get("payload")
+        if payload is None and raw.get("payload_file"):
+            if not allow_local_paths:
+                raise ValueError(f"Item {n}: payload_file is not allowed here")
+            path = Path(raw["payload_file"])
+            with open(base_dir / path if base_dir and not path.is_absolute() else path) as f:
+                payload = json.load(f)
+        if not isinstance(payload, dict) or "project" not in payload:
+            raise ValueError(f"Item {n}: payload with a project is required")
+
+        pdf = raw.get("pdf") or raw.get("pdf_url")
+        if pdf and not _is_url(pdf):
+            if not allow_local_paths:
+                raise ValueError(f"Item {n}: only http(s) PDF URLs are allowed here")
+            path = Path(pdf)
+            pdf = str(base_dir / path if base_dir and not path.is_absolute() else path)
+        items.append(BatchItem(id=str(raw.get("id", n)), payload=payload, pdf=pdf))
+    return items
+
+
+def load_manifest(path: str) -> list[BatchItem]:
+    text = Path(path).read_text()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        raw_items = json.loads(stripped)
+    else:
+        raw_items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return parse_items(raw_items, base_dir=Path(path).parent)
+
+
+def _run_item(item: BatchItem, job_store: JobStore, use_cache: bool, upload: bool) -> dict:
+    # The job and its workspace only exist once the item is actually picked up
+    job, _ = job_store.create()
+    job.state = "running"
+    job.started_at = time.time()
+    cleanup = None
+    try:
+        pdf_path = item.pdf
+        if pdf_path and _is_url(pdf_path):
+            with job.stage("download"):
+                pdf_path = cleanup = download_signed_pdf(pdf_path)
+            job.count("bytes_downloaded", os.path.getsize(pdf_path))
+        elif pdf_path and not Path(pdf_path).exists():
+            raise FileNotFoundError(f"PDF not found: {pdf_path}")
+
+        job.result = run_pipeline(item.payload, pdf_path, job=job, use_cache=use_cache, upload=upload)
+        job.state = "succeeded"
+    except Exception as exc:  # noqa: BLE001 one bad contract must not stop the batch
+        job.state = "failed"
+        job.error = str(exc)
+    finally:
+        job.finished_at = time.time()
+        if cleanup:
+            Path(cleanup).unlink(missing_ok=True)
+
+    return _outcome(item, job)
+
+
+def _outcome(item: BatchItem, job: Job | None, error: str | None = None) -> dict:
+    if job is None:
+        return {"id": item.id, "job_id": None, "state": "failed", "seconds": 0.0, "error": error}
+    result = job.result or {}
+    return {
+        "id": item.id,
+        "job_id": job.id,
+        "state": job.state,
+        "seconds": round(job.finished_at - job.started_at, 3),
+        "stages": dict(job.stages),
+        "counters": dict(job.counters),
+        "outputs": dict(job.outputs),
+        "odoo": result.get("odoo"),
+        "odoo_error": result.get("odoo_error"),
+        "error": job.error,
+    }
+
+
+def _warm_up(upload: bool):
+    # Pay for process-pool start and Odoo login once, before the clock starts
+    get_pool()
+    if upload and leased_client is not None and os.getenv("ODOO_UPLOAD_ENABLED", "true").lower() != "false":
+        try:
+            with leased_client() as client:
+                client.authenticate()
+        except ValueError as cfg_err:
+            print(f"Odoo upload will be skipped (config missing): {cfg_err}")
+        except Exception as exc:  # noqa: BLE001 items retry the login themselves
+            print(f"Warning: Odoo login failed during warm-up: {exc}")
+
+
+def run_batch(
+    items: list[BatchItem],
+    job_store: JobStore,
+    job_queue: JobQueue,
+    use_cache: bool = True,
+    upload: bool = True,
+    report_path: Path | None = None,
+    progress: Job | None = None,
+    max_in_flight: int | None = None,
+) -> dict:
+    """
+    Feeds every item through job_queue, the same bounded queue and workers
+    the webhook uses, and returns the summary. At most max_in_flight items
+    (default: the queue's worker count) are queued or running at once, so a
+    batch never fills the queue ahead of other traffic. With report_path,
+    one JSON line per item is written as it finishes, then a summary line,
+    so an interrupted backfill still leaves a usable report. progress, when
+    given, has its counters updated live.
+    """
+    max_in_flight = max(1, max_in_flight or job_queue.worker_count)
+    _warm_up(upload)
+
+    report = open(report_path, "w") if report_path else None
+    lock = threading.Lock()
+    in_flight = threading.Semaphore(max_in_flight)
+    all_done = threading.Event()
+    counts = {"succeeded": 0, "failed": 0}
+    finished = 0
+    started = time.perf_counter()
+    print(f"Batch: {len(items)} contracts on {job_queue.worker_count} shared workers")
+
+    def _record(outcome: dict):
+        nonlocal finished
+        with lock:
+            counts[outcome["state"]] += 1
+            finished += 1
+            done = finished
+            if report:
+                report.write(json.dumps(outcome, default=str) + "\n")
+                report.flush()
+            # Under the lock, so the counters never lag the report
+            if progress is not None:
+                progress.count(f"items_{outcome['state']}")
+        print(f"[{done}/{len(items)}] {outcome['id']}: {outcome['state']} in {outcome['seconds']:.1f}s"
+              + (f" ({outcome['error']})" if outcome["error"] else ""))
+        if done == len(items):
+            all_done.set()
+
+    def _task(item: BatchItem):
+        try:
+            _record(_run_item(item, job_store, use_cache, upload))
+        finally:
+            in_flight.release()
+
+    try:
+        for item in items:
+            in_flight.acquire()
+            while True:
+                try:
+                    job_queue.submit(_task, item)
+                    break
+                except QueueFull:
+                    if not job_queue.accepting:
+                        in_flight.release()
+                        _record(_outcome(item, None, "Job queue is shutting down"))
+                        break
+                    # Webhook traffic has the queue full; wait for a free slot
+                    time.sleep(1)
+        if items:
+            all_done.wait()
+
+        wall = time.perf_counter() - started
+        summary = {
+            "items": len(items),
+            "succeeded": counts["succeeded"],
+            "failed": counts["failed"],
+            "workers": job_queue.worker_count,
+            "wall_seconds": round(wall, 3),
+            "contracts_per_minute": round(60 * counts["succeeded"] / wall, 2) if wall > 0 else None,
+        }
+        if report:
+            report.write(json.dumps({"summary": summary}) + "\n")
+    finally:
+        if report:
+            report.close()
+
+    print(
+        f"Batch done: {summary['succeeded']} succeeded, {summary['failed']} failed in "
+        f"{summary['wall_seconds']:.1f}s ({summary['contracts_per_minute']} contracts/min)"
+    )
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("manifest")
+    parser.add_argument("--report", default="batch_report.jsonl", help="per-item JSON Lines report")
+    parser.add_argument("--workers", type=int, help="contracts processed at once (default BATCH_WORKERS)")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the result cache")
+    parser.add_argument("--no-upload", action="store_true", help="skip the Odoo upload")
+    args = parser.parse_args()
+
+    items = load_manifest(args.manifest)
+    workers = args.workers or int(os.getenv("BATCH_WORKERS", os.getenv("PIPELINE_WORKERS", "2")))
+    job_queue = JobQueue(workers=workers, max_queued=workers)
+    try:
+        summary = run_batch(
+            items,
+            JobStore.from_env(),
+            job_queue,
+            use_cache=not args.no_cache,
+            upload=not args.no_upload,
+            report_path=Path(args.report),
+        )
+    finally:
+        job_queue.shutdown()
+    print(f"Report written to {args.report}")
+    raise SystemExit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
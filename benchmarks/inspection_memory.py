@@ -0,0 +1,88 @@
+"""
+Memory curve of the inspection-image stage: the old list of 250 DPI page
+images vs the streamed, spooled thumbnails. Every page of the input PDF is
+treated as an inspection page; each mode runs in a fresh process.
+
+    python -m benchmarks.inspection_memory data/signed1.pdf --pages 30
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+
+import fitz
+
+from pdf_images import ThumbnailSpool, _embedded_photos, _snapshot_dpi
+from raster import pixmap_to_image, render_page
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        # macOS and friends: peak is the best we can do
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_list(pdf_path: str, pages: int) -> list[float]:
+    doc = fitz.open(pdf_path)
+    images = []
+    curve = [rss_mb()]
+    for i in range(min(pages, len(doc))):
+        pix = render_page(doc[i], 250)
+        images.append({"page": i + 1, "image": pixmap_to_image(pix)})
+        curve.append(rss_mb())
+    return curve
+
+
+def _run_spool(pdf_path: str, pages: int) -> list[float]:
+    doc = fitz.open(pdf_path)
+    spool = ThumbnailSpool()
+    curve = [rss_mb()]
+    try:
+        for i in range(min(pages, len(doc))):
+            page = doc[i]
+            photos = list(_embedded_photos(doc, page))
+            if not photos:
+                photos = [pixmap_to_image(render_page(page, _snapshot_dpi(page)))]
+            for img in photos:
+                spool.add_image(i + 1, img)
+            curve.append(rss_mb())
+    finally:
+        spool.close()
+    return curve
+
+
+def _in_fresh_process(func, *args):
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--json", help="write the curves to this file")
+    args = parser.parse_args()
+
+    curves = {
+        "list_250dpi": _in_fresh_process(_run_list, args.pdf, args.pages),
+        "spooled_thumbnails": _in_fresh_process(_run_spool, args.pdf, args.pages),
+    }
+
+    print(f"{'pages':>5}  {'list (MB)':>10}  {'spool (MB)':>10}")
+    for i, (a, b) in enumerate(zip(curves["list_250dpi"], curves["spooled_thumbnails"])):
+        print(f"{i:>5}  {a:>10.1f}  {b:>10.1f}")
+    print(f"peak   {max(curves['list_250dpi']):>10.1f}  {max(curves['spooled_thumbnails']):>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(curves, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Times and memory-profiles every run_pipeline stage on synthetic contracts
+of several sizes, with Odoo replaced by the local mock server. Each run
+happens in a fresh process so memory numbers don't leak between runs.
+
+    python -m benchmarks.pipeline_bench --pages 5 20 80 200 --runs 3
+    python -m benchmarks.pipeline_bench --compare old.json new.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+
+from benchmarks.inspection_memory import rss_mb
+from benchmarks.synthetic import make_contract, make_payload
+from jobs import Job
+
+RESULTS_DIR = Path("benchmarks/results")
+
+
+class _RssSampler:
+    """Polls RSS in the background so each stage gets its peak, not just start/end."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def reset(self):
+        self.peak = rss_mb()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class ProfiledJob(Job):
+    """A Job whose stages also record RSS at start, peak and end."""
+
+    def __init__(self, *args, sampler: _RssSampler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sampler = sampler
+        self.memory = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = rss_mb()
+        self.sampler.reset()
+        try:
+            with super().stage(name):
+                yield
+        finally:
+            self.memory[name] = {
+                "rss_start_mb": round(start, 1),
+                "rss_peak_mb": round(max(self.sampler.peak, rss_mb()), 1),
+                "rss_end_mb": round(rss_mb(), 1),
+            }
+
+
+def _run_once(pdf_path: str, payload: dict, workspace: str) -> dict:
+    # Runs in a fresh spawn process
+    from ocr_pool import shutdown_pool
+    from pipeline import run_pipeline
+
+    with _RssSampler() as sampler:
+        job = ProfiledJob(id="bench", workspace=Path(workspace), sampler=sampler)
+        baseline = rss_mb()
+        started = time.perf_counter()
+        result = run_pipeline(payload, signed_pdf_path=pdf_path, job=job, use_cache=False)
+        wall = time.perf_counter() - started
+        peak = max(sampler.peak, rss_mb())
+
+    shutdown_pool()
+    return {
+        "wall_seconds": round(wall, 3),
+        "rss_baseline_mb": round(baseline, 1),
+        "rss_peak_mb": round(peak, 1),
+        # Largest OCR worker process; they are children of this one
+        "ocr_worker_peak_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stages": {
+            name: {"seconds": seconds, **job.memory.get(name, {})}
+            for name, seconds in job.stages.items()
+        },
+        "counters": dict(job.counters),
+        "odoo": result.get("odoo"),
+        "odoo_error": result.get("odoo_error"),
+    }
+
+
+def _in_fresh_process(func, *args):
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+@contextmanager
+def local_odoo():
+    """Serves mock_odoo on a free local port and points the Odoo env vars at it."""
+    from werkzeug.serving import make_server
+
+    from mock_odoo import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    overrides = {
+        "ODOO_URL": f"http://127.0.0.1:{server.server_port}",
+        "ODOO_DB": "bench",
+        "ODOO_USERNAME": "bench",
+        "ODOO_PASSWORD": "bench",
+        "ODOO_UPLOAD_ENABLED": "true",
+    }
+    previous = {k: os.environ.get(k) for k in overrides}
+    os.environ.update(overrides)
+    try:
+        yield overrides["ODOO_URL"]
+    finally:
+        for k, v in previous.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        server.shutdown()
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:  # noqa: BLE001 not a checkout
+        return None
+
+
+def _summarize(runs: list[dict]) -> dict:
+    summary = {}
+    for pages in sorted({r["pages"] for r in runs}):
+        group = [r for r in runs if r["pages"] == pages]
+        stage_names = sorted({s for r in group for s in r["stages"]})
+        summary[str(pages)] = {
+            "wall_seconds": round(statistics.median(r["wall_seconds"] for r in group), 3),
+            "rss_peak_mb": max(r["rss_peak_mb"] for r in group),
+            "stages": {
+                name: round(statistics.median(r["stages"][name]["seconds"] for r in group if name in r["stages"]), 4)
+                for name in stage_names
+            },
+        }
+    return summary
+
+
+def run(pages_list: list[int], runs: int, scanned: bool, page_index: bool) -> dict:
+    # Cold by default: a warm page index would hide OCR cost for boilerplate
+    os.environ["PAGE_INDEX_ENABLED"] = "true" if page_index else "false"
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pipeline_bench_") as tmp, local_odoo() as odoo_url:
+        for pages in pages_list:
+            pdf_path = os.path.join(tmp, f"contract_{pages}.pdf")
+            contract = make_contract(pdf_path, pages, seed=pages, scanned=scanned)
+            for i in range(runs):
+                # Every run uploads into an empty Odoo, so none is skipped as unchanged
+                requests.post(f"{odoo_url}/mock/reset", timeout=10)
+                workspace = os.path.join(tmp, f"job_{pages}_{i}")
+                measured = _in_fresh_process(_run_once, pdf_path, make_payload(pages), workspace)
+                measured.update(pages=pages, run=i, contract=contract)
+                results.append(measured)
+                print(
+                    f"{pages:>4} pages  run {i + 1}/{runs}  {measured['wall_seconds']:>8.2f} s  "
+                    f"peak {measured['rss_peak_mb']:>7.1f} MB"
+                )
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scanned": scanned,
+            "page_index": page_index,
+            "env": {k: os.environ[k] for k in sorted(os.environ) if k.startswith(("OCR_", "INSPECTION_", "RENDER_"))},
+        },
+        "summary": _summarize(results),
+        "runs": results,
+    }
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)["summary"]
+    with open(new_path) as f:
+        new = json.load(f)["summary"]
+
+    for pages in sorted(set(old) & set(new), key=int):
+        a, b = old[pages], new[pages]
+        print(f"{pages} pages: {a['wall_seconds']:.2f} s -> {b['wall_seconds']:.2f} s, "
+              f"peak {a['rss_peak_mb']:.1f} -> {b['rss_peak_mb']:.1f} MB")
+        for stage in sorted(set(a["stages"]) | set(b["stages"])):
+            before, after = a["stages"].get(stage), b["stages"].get(stage)
+            change = f"{100 * (after - before) / before:+.0f}%" if before and after is not None else ""
+            print(f"    {stage:<16} {before if before is not None else '-':>10}  {after if after is not None else '-':>10}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 80, 200])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--native", action="store_true", help="keep the text layer instead of scanning pages")
+    parser.add_argument("--page-index", action="store_true", help="leave the boilerplate page index on")
+    parser.add_argument("--out", help="JSON file to write (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.pages, args.runs, scanned=not args.native, page_index=args.page_index)
+    out = Path(args.out) if args.out else RESULTS_DIR / f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Per-page cost of moving a rendered page from PyMuPDF into PIL and on to
+Tesseract's input file: PNG/JPEG round trip vs raw samples.
+
+    python -m benchmarks.raster_bench data/signed1.pdf --pages 10 --dpi 150
+"""
+import argparse
+import os
+import tempfile
+import time
+from io import BytesIO
+
+import fitz
+from PIL import Image
+
+from raster import as_tesseract_input, pixmap_to_image, render_page
+
+
+def _codec_path(page, dpi: int) -> Image.Image:
+    pix = page.get_pixmap(dpi=dpi)
+    img = Image.open(BytesIO(pix.tobytes("png")))
+    img.load()
+    return img
+
+
+def _raw_path(page, dpi: int) -> Image.Image:
+    pix = render_page(page, dpi, gray=True)
+    img = pixmap_to_image(pix)
+    return img
+
+
+def _tesseract_write(img: Image.Image, fmt: str, path: str):
+    # What pytesseract does before spawning tesseract
+    img.save(path, format=fmt)
+
+
+def _time_ms(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return 1000 * (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf)
+    pages = [doc[i] for i in range(min(args.pages, len(doc)))]
+    tmp_dir = tempfile.mkdtemp(prefix="raster_bench_")
+
+    totals = {"decode_png": 0.0, "decode_raw": 0.0, "write_png": 0.0, "write_ppm": 0.0}
+    for page in pages:
+        totals["decode_png"] += _time_ms(lambda: _codec_path(page, args.dpi), args.repeat)
+        totals["decode_raw"] += _time_ms(lambda: _raw_path(page, args.dpi), args.repeat)
+
+        img = as_tesseract_input(_raw_path(page, args.dpi))
+        png_path = os.path.join(tmp_dir, "page.png")
+        ppm_path = os.path.join(tmp_dir, "page.ppm")
+        totals["write_png"] += _time_ms(lambda: _tesseract_write(img, "PNG", png_path), args.repeat)
+        totals["write_ppm"] += _time_ms(lambda: _tesseract_write(img, "PPM", ppm_path), args.repeat)
+
+    n = len(pages) or 1
+    codec = (totals["decode_png"] + totals["write_png"]) / n
+    raw = (totals["decode_raw"] + totals["write_ppm"]) / n
+    print(f"{len(pages)} pages at {args.dpi} DPI, {args.repeat} repeats")
+    print(f"  pixmap -> PIL   png: {totals['decode_png'] / n:8.1f} ms/page   raw: {totals['decode_raw'] / n:8.1f} ms/page")
+    print(f"  tesseract input png: {totals['write_png'] / n:8.1f} ms/page   ppm: {totals['write_ppm'] / n:8.1f} ms/page")
+    print(f"  total           png: {codec:8.1f} ms/page   raw: {raw:8.1f} ms/page   saved: {codec - raw:.1f} ms/page")
+
+
+if __name__ == "__main__":
+    main()
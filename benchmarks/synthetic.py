@@ -0,0 +1,182 @@
+"""
+Synthetic signed SumoQuote contracts for benchmarking: a cover page,
+inspection photo pages, a Preferred Package section with line items and a
+total, an authorization page and boilerplate terms that are identical in
+every contract.
+
+    python -m benchmarks.synthetic out.pdf --pages 40 --scanned
+"""
+import argparse
+import random
+from io import BytesIO
+
+import fitz
+from PIL import Image, ImageDraw
+
+PAGE_SIZE = (612, 792)  # US Letter in points
+MARGIN = 54
+
+SCOPE_ITEMS = [
+    ("Remove existing roofing", "Tear off all layers of composition shingles down to the deck and haul away debris."),
+    ("Install synthetic underlayment", "Cover the full deck with synthetic underlayment, lapped and fastened per manufacturer."),
+    ("Ice and water shield", "Self-adhered membrane at eaves, valleys and around every penetration."),
+    ("Architectural shingles", "Install lifetime architectural shingles with six nails per shingle."),
+    ("Ridge vent", "Cut in and install shingle-over ridge vent for continuous attic ventilation."),
+    ("Drip edge", "New pre-finished aluminum drip edge at all eaves and rakes."),
+    ("Pipe boots", "Replace plumbing vent flashings with lead-free pipe boots."),
+    ("Step flashing", "Replace step and counter flashing at sidewalls and chimney."),
+    ("Starter strip", "Install starter strip shingles at eaves and rakes for wind resistance."),
+    ("Cleanup", "Magnetic sweep of yard and driveway, final walkthrough with the homeowner."),
+]
+
+BOILERPLATE = (
+    "TERMS AND CONDITIONS. Contractor shall furnish all labor, materials and equipment "
+    "necessary to complete the work described in this agreement in a workmanlike manner. "
+    "Any alteration or deviation from the specifications involving extra cost will be "
+    "executed only upon written change orders and will become an extra charge over and "
+    "above the estimate. All agreements are contingent upon strikes, accidents or delays "
+    "beyond our control. Owner agrees to carry fire, tornado and other necessary insurance. "
+    "Payment is due upon completion of the work unless financing has been arranged in "
+    "writing. Warranty coverage begins on the date of final payment and is transferable "
+    "once to a subsequent owner with written notice. "
+)
+
+
+def _photo(rng: random.Random, size=(1200, 900)) -> bytes:
+    # A colour gradient with some shapes: compresses like a real photo
+    # rather than flat colour or pure noise
+    img = Image.new("RGB", size, tuple(rng.randrange(60, 200) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(40, 400), y0 + rng.randrange(40, 300)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    img = Image.blend(img, noise, 0.25)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _heading(page, text: str):
+    page.insert_text((MARGIN, MARGIN + 24), text, fontsize=22, fontname="hebo")
+
+
+def _body(page, text: str, top: float = MARGIN + 60):
+    rect = fitz.Rect(MARGIN, top, PAGE_SIZE[0] - MARGIN, PAGE_SIZE[1] - MARGIN)
+    page.insert_textbox(rect, text, fontsize=10, fontname="helv")
+
+
+def layout(pages: int) -> dict:
+    """How many pages of each kind a contract of this size gets."""
+    if pages < 5:
+        raise ValueError("Synthetic contracts need at least 5 pages")
+    preferred = 1 if pages < 20 else 2
+    inspection = max(1, int(pages * 0.3))
+    boilerplate = pages - 1 - inspection - preferred - 1
+    return {"inspection": inspection, "preferred": preferred, "boilerplate": boilerplate}
+
+
+def make_contract(path: str, pages: int, seed: int = 0, scanned: bool = False, photos_per_page: int = 2) -> dict:
+    """
+    Writes a contract of exactly `pages` pages and returns what went into
+    it. scanned=True rasterises every page so no native text survives and
+    the OCR path is exercised.
+    """
+    rng = random.Random(seed)
+    counts = layout(pages)
+    doc = fitz.open()
+
+    cover = doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+    _heading(cover, "ROOF REPLACEMENT PROPOSAL")
+    _body(cover, f"Prepared for Customer {seed}\n{100 + seed} Main Street\nSpringfield, OR 97477\n\nProposal #{seed:06d}")
+
+    inspection_pages = []
+    for i in range(counts["inspection"]):
+        page = doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+        inspection_pages.append(doc.page_count)
+        if i == 0:
+            _heading(page, "INSPECTION")
+        page.insert_text((MARGIN, MARGIN + 56), f"Photo set {i + 1}: slope condition", fontsize=10, fontname="helv")
+        cell_height = (PAGE_SIZE[1] - 2 * MARGIN - 80) / photos_per_page
+        for j in range(photos_per_page):
+            top = MARGIN + 70 + j * cell_height
+            rect = fitz.Rect(MARGIN, top, PAGE_SIZE[0] - MARGIN, top + cell_height - 10)
+            page.insert_image(rect, stream=_photo(rng), keep_proportion=True)
+
+    items = rng.sample(SCOPE_ITEMS, k=min(len(SCOPE_ITEMS), 4 + counts["preferred"] * 3))
+    total = round(rng.uniform(9000, 38000), 2)
+    per_page = -(-len(items) // counts["preferred"])
+    preferred_pages = []
+    for i in range(counts["preferred"]):
+        page = doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+        preferred_pages.append(doc.page_count)
+        if i == 0:
+            _heading(page, "PREFERRED PACKAGE")
+        chunk = items[i * per_page:(i + 1) * per_page]
+        text = "\n".join(f"{title}\n{desc}\n" for title, desc in chunk)
+        if i == counts["preferred"] - 1:
+            text += f"\nQUOTE SUBTOTAL ${total:,.2f}\nTOTAL ${total:,.2f}\n"
+        _body(page, text)
+
+    authorization = doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+    _heading(authorization, "AUTHORIZATION PAGE")
+    _body(authorization, "By signing below the owner authorizes the work described above.\n\n\nSignature ____________________")
+
+    for _ in range(counts["boilerplate"]):
+        page = doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+        _body(page, BOILERPLATE * 4, top=MARGIN)
+
+    if scanned:
+        doc = _rasterize(doc)
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return {
+        "pages": pages,
+        "seed": seed,
+        "scanned": scanned,
+        "inspection_pages": inspection_pages,
+        "preferred_package_pages": preferred_pages,
+        "boilerplate_pages": counts["boilerplate"],
+        "line_items": len(items),
+        "total": total,
+    }
+
+
+def _rasterize(doc, dpi: int = 150):
+    out = fitz.open()
+    for page in doc:
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        scanned = out.new_page(width=page.rect.width, height=page.rect.height)
+        scanned.insert_image(scanned.rect, stream=pix.tobytes("png"))
+    doc.close()
+    return out
+
+
+def make_payload(seed: int = 0) -> dict:
+    # No line items, so the pipeline extracts them from the Preferred Package
+    return {
+        "project": {
+            "customer_name": f"Customer {seed}",
+            "address": f"{100 + seed} Main Street",
+            "city": "Springfield",
+            "state": "OR",
+            "postal_code": "97477",
+        },
+        "line_items": [],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scanned", action="store_true", help="image-only pages, forcing OCR")
+    args = parser.parse_args()
+    print(make_contract(args.out, args.pages, seed=args.seed, scanned=args.scanned))
+
+
+if __name__ == "__main__":
+    main()
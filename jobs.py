@@ -0,0 +1,348 @@
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    workspace: Path
+    state: str = "queued"  # queued, running, succeeded, failed
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    stages: dict = field(default_factory=dict)
+    counters: dict = field(default_factory=dict)
+    outputs: dict = field(default_factory=dict)
+    result: dict | None = None
+    error: str | None = None
+    idempotency_key: str | None = None
+    duplicates: int = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = round(self.stages.get(name, 0.0) + elapsed, 4)
+
+    def count(self, name: str, amount: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("succeeded", "failed")
+
+    @property
+    def partial_failure(self) -> bool:
+        # The PDFs were built but a later step, like the Odoo upload, failed
+        return bool((self.result or {}).get("odoo_error"))
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+            "outputs": dict(self.outputs),
+            "result": self.result,
+            "error": self.error,
+            "partial_failure": self.partial_failure,
+            "duplicates": self.duplicates,
+        }
+
+
+class JobStore:
+    """
+    Keeps track of jobs and gives each one its own output workspace.
+    Finished workspaces are evicted after a TTL, and oldest-first once the
+    jobs directory grows past a size cap.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        ttl_seconds: float,
+        max_bytes: int,
+        idempotency_window: float = 3600,
+        evict_interval: float = 10,
+    ):
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.idempotency_window = idempotency_window
+        self.evict_interval = evict_interval
+        self._last_evicted = None
+        self._jobs: dict[str, Job] = {}
+        self._by_key: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            root=Path(os.getenv("JOBS_DIR", "output/jobs")),
+            ttl_seconds=float(os.getenv("JOB_TTL_SECONDS", "86400")),
+            max_bytes=int(os.getenv("JOBS_MAX_BYTES", str(1024 ** 3))),
+            idempotency_window=float(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "3600")),
+            evict_interval=float(os.getenv("JOB_EVICT_INTERVAL_SECONDS", "10")),
+        )
+
+    def create(self, idempotency_key: str | None = None, create_workspace: bool = True) -> tuple[Job, bool]:
+        """
+        Returns (job, created). When a job with the same idempotency key is
+        still queued or running, or succeeded within the idempotency window,
+        that job is returned instead of a new one. Failed jobs, and jobs
+        that succeeded only partly (the Odoo upload failed), can be retried.
+        """
+        # Eviction walks every finished workspace; during a burst of creates
+        # (a batch backfill) once per interval is plenty
+        if self._last_evicted is None or time.monotonic() - self._last_evicted >= self.evict_interval:
+            self.evict()
+        with self._lock:
+            if idempotency_key:
+                existing = self._jobs.get(self._by_key.get(idempotency_key, ""))
+                if existing is not None and self._reusable(existing):
+                    existing.duplicates += 1
+                    return existing, False
+
+            job_id = uuid.uuid4().hex
+            job = Job(id=job_id, workspace=self.root / job_id, idempotency_key=idempotency_key)
+            self._jobs[job_id] = job
+            if idempotency_key:
+                self._by_key[idempotency_key] = job_id
+
+        if create_workspace:
+            job.workspace.mkdir(parents=True, exist_ok=True)
+        return job, True
+
+    def _reusable(self, job: Job) -> bool:
+        if not job.finished:
+            return True
+        if job.state != "succeeded" or job.partial_failure:
+            return False
+        return time.time() - (job.finished_at or job.created_at) <= self.idempotency_window
+
+    def _forget(self, job: Job):
+        self._jobs.pop(job.id, None)
+        if job.idempotency_key and self._by_key.get(job.idempotency_key) == job.id:
+            del self._by_key[job.idempotency_key]
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job: Job):
+        with self._lock:
+            self._forget(job)
+        shutil.rmtree(job.workspace, ignore_errors=True)
+
+    def evict(self):
+        self._last_evicted = time.monotonic()
+        now = time.time()
+        with self._lock:
+            finished = sorted(
+                (j for j in self._jobs.values() if j.finished),
+                key=lambda j: j.finished_at or j.created_at,
+            )
+            active = [j for j in self._jobs.values() if not j.finished]
+
+        # Workspaces are measured without the lock so creates don't wait on the walk
+        expired = [j for j in finished if now - (j.finished_at or j.created_at) > self.ttl_seconds]
+        remaining = [j for j in finished if j not in expired]
+        sizes = {j.id: _dir_size(j.workspace) for j in remaining}
+        total = sum(_dir_size(j.workspace) for j in active) + sum(sizes.values())
+        while remaining and total > self.max_bytes:
+            oldest = remaining.pop(0)
+            total -= sizes[oldest.id]
+            expired.append(oldest)
+
+        with self._lock:
+            for job in expired:
+                self._forget(job)
+
+        for job in expired:
+            shutil.rmtree(job.workspace, ignore_errors=True)
+
+    def sweep_orphans(self):
+        """
+        Removes workspaces this store doesn't know about, left behind by an
+        earlier process: those older than the TTL by last modification, and
+        then oldest first while the jobs directory is over the size cap.
+        """
+        if not self.root.is_dir():
+            return
+        with self._lock:
+            known = set(self._jobs)
+
+        orphans = []
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name not in known:
+                size, mtime = _dir_usage(path)
+                orphans.append((mtime, size, path))
+        orphans.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in orphans)
+        removed = 0
+        for mtime, size, path in orphans:
+            if now - mtime <= self.ttl_seconds and total <= self.max_bytes:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            print(f"Removed {removed} stale job workspaces from {self.root}")
+
+
+def _dir_size(path: Path) -> int:
+    return _dir_usage(path)[0]
+
+
+def _dir_usage(path: Path) -> tuple[int, float]:
+    """Total size of the files under path and the newest mtime among them."""
+    if not path.exists():
+        return 0, 0.0
+    size, newest = 0, path.stat().st_mtime
+    for f in path.rglob("*"):
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        newest = max(newest, st.st_mtime)
+        if f.is_file():
+            size += st.st_size
+    return size, newest
+
+
+class JobQueue:
+    """
+    Bounded FIFO of pipeline jobs served by a fixed set of worker threads.
+    submit() never blocks: when the queue is full it raises QueueFull so the
+    webhook can answer 503 instead of piling up OCR jobs.
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self.worker_count = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self._queue = queue.Queue(maxsize=self.max_queued)
+        self._lock = threading.Lock()
+        self._accepting = True
+        # Set by shutdown(); workers exit once it is set and the queue is empty
+        self._stop = threading.Event()
+        self._busy = 0
+        self._counters = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._busy_seconds = 0.0
+        self._started_at = time.monotonic()
+
+        self._threads = [
+            threading.Thread(target=self._work, name=f"pipeline-worker-{i}", daemon=True)
+            for i in range(self.worker_count)
+        ]
+        for t in self._threads:
+            t.start()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv("PIPELINE_WORKERS", "2")),
+            max_queued=int(os.getenv("PIPELINE_QUEUE_SIZE", "20")),
+        )
+
+    @property
+    def accepting(self) -> bool:
+        with self._lock:
+            return self._accepting
+
+    def submit(self, func, *args, job: Job | None = None, **kwargs):
+        with self._lock:
+            if not self._accepting:
+                self._counters["rejected"] += 1
+                raise QueueFull("Job queue is shutting down")
+            try:
+                self._queue.put_nowait((func, args, kwargs, job))
+            except queue.Full:
+                self._counters["rejected"] += 1
+                raise QueueFull(f"Job queue is full ({self.max_queued} waiting)") from None
+            self._counters["accepted"] += 1
+
+    def _work(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+
+            func, args, kwargs, tracked = job
+            with self._lock:
+                self._busy += 1
+            if tracked is not None:
+                tracked.state = "running"
+                tracked.started_at = time.time()
+
+            started = time.monotonic()
+            outcome = "failed"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "completed"
+                if tracked is not None:
+                    tracked.result = result
+            except Exception as exc:  # noqa: BLE001 keep the worker alive
+                print(f"Pipeline job failed: {exc}")
+                if tracked is not None:
+                    tracked.error = str(exc)
+            finally:
+                if tracked is not None:
+                    tracked.finished_at = time.time()
+                    tracked.state = "succeeded" if outcome == "completed" else "failed"
+                with self._lock:
+                    self._busy -= 1
+                    self._busy_seconds += time.monotonic() - started
+                    self._counters[outcome] += 1
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            uptime = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "workers": self.worker_count,
+                "busy_workers": self._busy,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.max_queued,
+                "utilization": round(self._busy_seconds / (uptime * self.worker_count), 4),
+                "accepting": self._accepting,
+                **self._counters,
+            }
+
+    def shutdown(self, timeout: float | None = None):
+        """
+        Stops accepting new jobs and lets the workers drain what is queued.
+        """
+        with self._lock:
+            if not self._accepting:
+                return
+            self._accepting = False
+
+        print(f"Draining job queue ({self._queue.qsize()} waiting)...")
+        self._stop.set()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            t.join(remaining)
@@ -1,13 +1,24 @@
-﻿import json
+﻿import atexit
+import json
 import os
-import tempfile
+import queue
 import threading
+import time
+import uuid
+import zipfile
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Optional
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 
-from pipeline import run_pipeline
+from batch import parse_items, run_batch
+from jobs import JobQueue, JobStore, QueueFull
+from metrics import metrics
+from pipeline import MAX_PDF_BYTES, PDF_CHUNK_SIZE, PdfTooLarge, run_pipeline, spool_pdf
+from page_index import get_page_index
+from profiling import profiled, should_profile
+from result_cache import cache_key, file_digest, get_result_cache
 from test_pipeline import run_test_pipeline
 
 try:
@@ -16,10 +27,22 @@ except Exception:
     ping_odoo = None
 
 app = Flask(__name__)
+# Reject oversize bodies before reading them; the slack covers the payload field
+app.config["MAX_CONTENT_LENGTH"] = MAX_PDF_BYTES + 1024 * 1024
 
 
 UPLOAD_KEY_CANDIDATES = ["signed_pdf", "file", "pdf"]
 
+IDEMPOTENCY_HEADERS = ["Idempotency-Key", "X-Idempotency-Key"]
+
+RETRY_AFTER_SECONDS = os.getenv("RETRY_AFTER_SECONDS", "30")
+
+job_queue = JobQueue.from_env()
+job_store = JobStore.from_env()
+# Workspaces from before a restart are unknown to the new store; clear them out
+threading.Thread(target=job_store.sweep_orphans, name="jobs-sweep", daemon=True).start()
+atexit.register(job_queue.shutdown, float(os.getenv("PIPELINE_DRAIN_TIMEOUT", "300")))
+
 
 def _parse_payload() -> dict:
     # Primary: JSON body
@@ -47,25 +70,88 @@ def _save_uploaded_pdf() -> Optional[str]:
     for key in UPLOAD_KEY_CANDIDATES:
         file = request.files.get(key)
         if file and file.filename:
-            fd, tmp_path = tempfile.mkstemp(suffix=Path(file.filename).suffix or ".pdf")
-            with os.fdopen(fd, "wb") as f:
-                f.write(file.read())
-            return tmp_path
+            chunks = iter(lambda: file.stream.read(PDF_CHUNK_SIZE), b"")
+            return spool_pdf(chunks, suffix=Path(file.filename).suffix or ".pdf")
     return None
 
 
-def _start_async_pipeline(payload: dict, signed_pdf_path: str | None = None, delete_after: bool = False):
+def _cache_bypassed() -> bool:
+    # ?nocache=1 or Cache-Control: no-cache re-runs everything from scratch
+    if request.args.get("nocache", "").lower() in ("1", "true", "yes"):
+        return True
+    return "no-cache" in request.headers.get("Cache-Control", "").lower()
+
+
+def _idempotency_key(payload: dict, signed_pdf_path: str | None, from_content: bool = True) -> str | None:
+    for header in IDEMPOTENCY_HEADERS:
+        value = request.headers.get(header)
+        if value:
+            return f"header:{value}"
+    if not from_content:
+        return None
+    # No explicit key: the same payload with the same PDF bytes is the same delivery
+    pdf_digest = file_digest(signed_pdf_path) if signed_pdf_path else None
+    return f"content:{cache_key(payload, pdf_digest)}"
+
+
+def _start_async_pipeline(
+    payload: dict,
+    signed_pdf_path: str | None = None,
+    delete_after: bool = False,
+    use_cache: bool = True,
+    idempotency_key: str | None = None,
+    profile: bool = False,
+):
+    job, created = job_store.create(idempotency_key)
+
+    def _cleanup():
+        if delete_after and signed_pdf_path:
+            try:
+                Path(signed_pdf_path).unlink(missing_ok=True)
+            except Exception as exc:  # noqa: BLE001
+                print(f"Warning: failed to delete uploaded PDF {signed_pdf_path}: {exc}")
+
+    if not created:
+        # Duplicate delivery: attach to the job already running (or just done)
+        _cleanup()
+        return job, False
+
     def _run():
         try:
-            run_pipeline(payload, signed_pdf_path)
+            with profiled(job) if profile else nullcontext():
+                return run_pipeline(payload, signed_pdf_path, job=job, use_cache=use_cache)
         finally:
-            if delete_after and signed_pdf_path:
-                try:
-                    Path(signed_pdf_path).unlink(missing_ok=True)
-                except Exception as exc:  # noqa: BLE001
-                    print(f"Warning: failed to delete uploaded PDF {signed_pdf_path}: {exc}")
+            _cleanup()
+
+    try:
+        job_queue.submit(_run, job=job)
+    except QueueFull:
+        _cleanup()
+        job_store.discard(job)
+        raise
+    return job, True
+
+
+def _job_accepted_response(job, created: bool, message: str):
+    if not created:
+        message = "Duplicate delivery; attached to existing job"
+    return jsonify({
+        "message": message,
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "state": job.state,
+        "duplicate": not created,
+    }), 202
 
-    threading.Thread(target=_run).start()
+
+def _profile_requested() -> bool:
+    return request.headers.get("X-Profile", "").lower() in ("1", "true", "yes")
+
+
+def _queue_full_response(exc: QueueFull):
+    resp = jsonify({"error": str(exc)})
+    resp.headers["Retry-After"] = RETRY_AFTER_SECONDS
+    return resp, 503
 
 
 @app.post("/")
@@ -75,16 +161,297 @@ def start_pipeline_route():
     except ValueError as exc:
         return jsonify({"error": str(exc)}), 400
 
-    uploaded_pdf = _save_uploaded_pdf()
+    try:
+        uploaded_pdf = _save_uploaded_pdf()
+    except PdfTooLarge as exc:
+        return jsonify({"error": str(exc)}), 413
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
     delete_after = uploaded_pdf is not None
 
-    _start_async_pipeline(payload, uploaded_pdf, delete_after=delete_after)
-    return jsonify({"message": "Summary PDF pipeline started"}), 202
+    # A manual re-run with the cache bypassed should not attach to an
+    # earlier job just because the content matches
+    use_cache = not _cache_bypassed()
+
+    try:
+        job, created = _start_async_pipeline(
+            payload,
+            uploaded_pdf,
+            delete_after=delete_after,
+            use_cache=use_cache,
+            idempotency_key=_idempotency_key(payload, uploaded_pdf, from_content=use_cache),
+            profile=should_profile(_profile_requested()),
+        )
+    except QueueFull as exc:
+        return _queue_full_response(exc)
+    return _job_accepted_response(job, created, "Summary PDF pipeline started")
+
+
+@app.post("/batch")
+def start_batch_route():
+    """
+    Body: {"items": [{"id": ..., "payload": {...}, "pdf_url": "https://..."}],
+    "upload": true}. Each contract is its own job on the shared job queue,
+    a few at a time, so a batch shares the workers with webhook traffic.
+    The batch job tracks progress and holds the per-item report.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("items"), list):
+        return jsonify({"error": "Expected a JSON object with an items list"}), 400
+    try:
+        # Only URLs here: a request must not be able to read server files
+        items = parse_items(body["items"], allow_local_paths=False)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if not job_queue.accepting:
+        return _queue_full_response(QueueFull("Job queue is shutting down"))
+
+    upload = bool(body.get("upload", True))
+    use_cache = not _cache_bypassed()
+    batch_job, _ = job_store.create()
+    report_path = batch_job.workspace / "batch_report.jsonl"
+    batch_job.outputs["report"] = str(report_path)
+
+    def _feed():
+        # Not a queue job itself: it waits on the items, which need the workers
+        batch_job.state = "running"
+        batch_job.started_at = time.time()
+        try:
+            batch_job.result = run_batch(
+                items, job_store, job_queue, use_cache=use_cache, upload=upload,
+                report_path=report_path, progress=batch_job,
+            )
+            batch_job.state = "succeeded"
+        except Exception as exc:  # noqa: BLE001 surface it on the batch job
+            print(f"Batch {batch_job.id} failed: {exc}")
+            batch_job.error = str(exc)
+            batch_job.state = "failed"
+        finally:
+            batch_job.finished_at = time.time()
+
+    threading.Thread(target=_feed, name=f"batch-{batch_job.id[:8]}", daemon=True).start()
+    return _job_accepted_response(batch_job, True, f"Batch of {len(items)} contracts started")
+
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+PDF_FILENAMES = {"quantity": "roof_scope_quantity.pdf", "price": "roof_scope_price.pdf"}
+SYNC_TIMEOUT_SECONDS = float(os.getenv("SYNC_TIMEOUT_SECONDS", "120"))
+SYNC_MAX_TIMEOUT_SECONDS = float(os.getenv("SYNC_MAX_TIMEOUT_SECONDS", "600"))
+
+
+def _query_flag(name: str, default: bool) -> bool:
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+class _ChunkSink:
+    """Write-only file object that zipfile streams into; take() drains it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _bundle_parts(fmt: str, events):
+    """
+    Streams (filename, content_type, data) parts as a zip archive or a
+    multipart/mixed body. Returns (mimetype, generator).
+    """
+    if fmt == "zip":
+        def _zip():
+            sink = _ChunkSink()
+            # PDFs are already compressed; stored entries stream without delay
+            with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+                for filename, _, data in events:
+                    zf.writestr(filename, data)
+                    yield sink.take()
+            yield sink.take()
+        return "application/zip", _zip()
+
+    boundary = uuid.uuid4().hex
+
+    def _multipart():
+        for filename, content_type, data in events:
+            yield (
+                f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                f'Content-Disposition: attachment; filename="{filename}"\r\n\r\n'
+            ).encode("ascii") + data + b"\r\n"
+        yield f"--{boundary}--\r\n".encode("ascii")
+    return f"multipart/mixed; boundary={boundary}", _multipart()
+
+
+@app.post("/sync")
+def sync_pipeline_route():
+    """
+    Runs the pipeline while the caller waits and returns the PDFs.
+    Query: pdf=quantity|price|both, format=pdf|zip|multipart, timeout=<s>,
+    store=0 to keep the run off disk (job workspace, result cache and page
+    index), upload=0 to skip Odoo.
+    """
+    wanted = {"both": ["quantity", "price"], "quantity": ["quantity"], "price": ["price"]}.get(
+        request.args.get("pdf", "both").lower()
+    )
+    if wanted is None:
+        return jsonify({"error": "pdf must be quantity, price or both"}), 400
+    fmt = request.args.get("format", "pdf" if len(wanted) == 1 else "zip").lower()
+    if fmt not in ("pdf", "zip", "multipart") or (fmt == "pdf" and len(wanted) > 1):
+        return jsonify({"error": "format must be pdf (single PDF only), zip or multipart"}), 400
+    try:
+        timeout = min(float(request.args.get("timeout", SYNC_TIMEOUT_SECONDS)), SYNC_MAX_TIMEOUT_SECONDS)
+    except ValueError:
+        return jsonify({"error": "timeout must be a number of seconds"}), 400
+
+    try:
+        payload = _parse_payload()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    try:
+        uploaded_pdf = _save_uploaded_pdf()
+    except PdfTooLarge as exc:
+        return jsonify({"error": str(exc)}), 413
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    store = _query_flag("store", True)
+    upload = _query_flag("upload", True)
+    use_cache = not _cache_bypassed()
+    profile = should_profile(_profile_requested())
+
+    job, _ = job_store.create(create_workspace=store)
+    ready = queue.Queue()
+
+    def _cleanup():
+        if uploaded_pdf:
+            Path(uploaded_pdf).unlink(missing_ok=True)
+
+    def _run():
+        try:
+            with profiled(job) if profile else nullcontext():
+                result = run_pipeline(
+                    payload,
+                    uploaded_pdf,
+                    job=job,
+                    use_cache=use_cache,
+                    write_outputs=store,
+                    upload=upload,
+                    on_pdf=lambda kind, pdf: ready.put((kind, pdf)),
+                )
+            ready.put(("done", result))
+            return result
+        except Exception as exc:
+            ready.put(("error", exc))
+            raise
+        finally:
+            _cleanup()
+
+    # Sync runs share the job queue, so they count against the same OCR capacity
+    try:
+        job_queue.submit(_run, job=job)
+    except QueueFull as exc:
+        _cleanup()
+        job_store.discard(job)
+        return _queue_full_response(exc)
+
+    deadline = time.monotonic() + timeout
+
+    def _next_event():
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "timeout", None
+            try:
+                kind, value = ready.get(timeout=remaining)
+            except queue.Empty:
+                return "timeout", None
+            if kind in wanted or kind in ("done", "error"):
+                return kind, value
+
+    headers = {"X-Job-Id": job.id}
+    kind, value = _next_event()
+    if kind == "error":
+        return jsonify({"error": str(value), "job_id": job.id}), 500, headers
+    if kind == "timeout":
+        # The job keeps running; its status stays available under /jobs
+        return jsonify({
+            "error": f"No PDF ready within {timeout:g}s",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+        }), 504, headers
+
+    if fmt == "pdf":
+        headers["Content-Disposition"] = f'attachment; filename="{PDF_FILENAMES[kind]}"'
+        return Response(value, mimetype="application/pdf", headers=headers)
+
+    def _events(first):
+        # PDFs as they are merged, then the run's result (or what went wrong)
+        pending = list(wanted)
+        kind, value = first
+        while True:
+            if kind in pending:
+                pending.remove(kind)
+                yield PDF_FILENAMES[kind], "application/pdf", value
+            elif kind == "done":
+                yield "result.json", "application/json", json.dumps(value, default=str).encode("utf-8")
+                return
+            else:
+                error = str(value) if kind == "error" else f"Deadline of {timeout:g}s reached"
+                body = {"error": error, "job_id": job.id, "missing": pending}
+                yield "error.json", "application/json", json.dumps(body).encode("utf-8")
+                return
+            kind, value = _next_event()
+
+    mimetype, body = _bundle_parts(fmt, _events((kind, value)))
+    return Response(body, mimetype=mimetype, headers=headers)
 
 
 @app.get("/health")
 def health():
-    return jsonify({"status": "ok"}), 200
+    page_index = get_page_index()
+    return jsonify({
+        "status": "ok",
+        "queue": job_queue.stats(),
+        "cache": get_result_cache().stats(),
+        "page_index": page_index.stats() if page_index else None,
+    }), 200
+
+
+@app.get("/metrics")
+def metrics_route():
+    queue = job_queue.stats()
+    gauges = {
+        "pipeline_queue_depth": queue["queue_depth"],
+        "pipeline_queue_capacity": queue["queue_capacity"],
+        "pipeline_busy_workers": queue["busy_workers"],
+        "pipeline_worker_utilization": queue["utilization"],
+        "result_cache_bytes": get_result_cache().stats()["bytes"],
+    }
+    counters = {"pipeline_jobs_rejected_total": queue["rejected"]}
+    page_index = get_page_index()
+    if page_index:
+        index_stats = page_index.stats()
+        counters["page_index_lookups_total"] = index_stats["lookups"]
+        counters["page_index_hits_total"] = index_stats["hits"]
+    return Response(metrics.render(gauges, counters), mimetype="text/plain; version=0.0.4")
 
 
 @app.get("/test")
@@ -125,7 +492,15 @@ def main(request):
     except ValueError as exc:
         return jsonify({"error": str(exc)}), 400
 
-    _start_async_pipeline(payload, None)
+    try:
+        _start_async_pipeline(
+            payload,
+            None,
+            idempotency_key=_idempotency_key(payload, None),
+            profile=should_profile(_profile_requested()),
+        )
+    except QueueFull as exc:
+        return _queue_full_response(exc)
     return "Summary PDF pipeline started", 202
 
 
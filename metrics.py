@@ -0,0 +1,110 @@
+import math
+import threading
+
+from jobs import Job
+
+# Seconds; pipeline stages range from a few ms (cache hits) to minutes (OCR)
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _labels(label: str | None, value: str | None) -> str:
+    return f'{{{label}="{value}"}}' if label and value is not None else ""
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label: str | None = None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: dict[str | None, float] = {}
+
+    def inc(self, amount: float = 1, label_value: str | None = None):
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def lines(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self._values.items(), key=lambda kv: str(kv[0])):
+            out.append(f"{self.name}{_labels(self.label, label_value)} {_format(value)}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label: str | None = None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series: dict[str | None, dict] = {}
+
+    def observe(self, value: float, label_value: str | None = None):
+        series = self._series.setdefault(label_value, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def lines(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self._series.items(), key=lambda kv: str(kv[0])):
+            prefix = f'{self.label}="{label_value}",' if self.label and label_value is not None else ""
+            for bound, count in zip(self.buckets, series["counts"]):
+                out.append(f'{self.name}_bucket{{{prefix}le="{_format(bound)}"}} {count}')
+            labels = _labels(self.label, label_value)
+            out.append(f"{self.name}_sum{labels} {_format(series['sum'])}")
+            out.append(f"{self.name}_count{labels} {series['count']}")
+        return out
+
+
+class Metrics:
+    """
+    Process-wide aggregate of finished jobs: per-stage timing histograms
+    and totals of every counter a job recorded. Rendered in the Prometheus
+    text format by render().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = Counter("pipeline_jobs_total", "Pipeline runs by final state.", label="state")
+        self.job_seconds = Histogram("pipeline_job_seconds", "Wall time of a whole pipeline run.")
+        self.stage_seconds = Histogram("pipeline_stage_seconds", "Wall time per pipeline stage.", label="stage")
+        self._counters: dict[str, Counter] = {}
+
+    def record_job(self, job: Job, seconds: float, state: str):
+        with self._lock:
+            self.jobs.inc(1, state)
+            self.job_seconds.observe(seconds)
+            for stage, elapsed in job.stages.items():
+                self.stage_seconds.observe(elapsed, stage)
+            for name, amount in job.counters.items():
+                counter = self._counters.get(name)
+                if counter is None:
+                    counter = Counter(f"pipeline_{name}_total", f"Sum of the per-job {name} counter.")
+                    self._counters[name] = counter
+                counter.inc(amount)
+
+    def render(self, gauges: dict[str, float] | None = None, counters: dict[str, float] | None = None) -> str:
+        """
+        Text exposition of everything recorded so far. gauges adds
+        point-in-time values (queue depth and the like) read at scrape time;
+        counters adds running totals kept elsewhere, named with _total.
+        """
+        with self._lock:
+            lines = self.jobs.lines() + self.job_seconds.lines() + self.stage_seconds.lines()
+            for name in sorted(self._counters):
+                lines += self._counters[name].lines()
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name, value in sorted((values or {}).items()):
+                if value is None:
+                    continue
+                lines += [f"# TYPE {name} {kind}", f"{name} {_format(value if kind == 'counter' else float(value))}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,181 @@
+"""
+Minimal stand-in for the Odoo JSON-RPC endpoints the client uses, for
+exercising uploads locally:
+
+    python mock_odoo.py            # listens on MOCK_ODOO_PORT (8069)
+    ODOO_URL=http://localhost:8069 ODOO_DB=mock ODOO_USERNAME=u ODOO_PASSWORD=p ...
+
+Faults can be injected with POST /mock/faults, e.g. {"fail_next": 2} to
+answer the next two calls with 503, {"lose_next_create": 1} to apply the
+next create but answer it with 502 (the reply lost on the way back), or
+{"expire_sessions": true} to drop every session.
+"""
+import base64
+import hashlib
+import itertools
+import os
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+SESSION_TTL = float(os.getenv("MOCK_ODOO_SESSION_TTL", "3600"))
+FAIL_RATE = float(os.getenv("MOCK_ODOO_FAIL_RATE", "0"))
+LATENCY = float(os.getenv("MOCK_ODOO_LATENCY", "0"))
+
+_lock = threading.Lock()
+_sessions: dict[str, float] = {}
+_attachments: dict[int, dict] = {}
+_ids = itertools.count(1)
+_faults = {"fail_next": 0, "lose_next_create": 0}
+_counters = {"authenticate": 0, "call_kw": 0, "failed": 0}
+
+
+def _error(code: int, name: str, message: str):
+    return jsonify({
+        "jsonrpc": "2.0",
+        "id": 1,
+        "error": {"code": code, "message": message, "data": {"name": name, "message": message}},
+    })
+
+
+def _store(attachment_id: int, vals: dict):
+    record = dict(_attachments.get(attachment_id, {}), **vals, id=attachment_id)
+    if "datas" in vals:
+        raw = base64.b64decode(vals["datas"])
+        record["checksum"] = hashlib.sha1(raw).hexdigest()
+        record["file_size"] = len(raw)
+    _attachments[attachment_id] = record
+
+
+def _matches(record: dict, domain: list) -> bool:
+    for field, op, value in domain:
+        if op == "=" and record.get(field) != value:
+            return False
+        if op == "in" and record.get(field) not in value:
+            return False
+    return True
+
+
+def _injected_failure():
+    with _lock:
+        if _faults["fail_next"] > 0:
+            _faults["fail_next"] -= 1
+            fail = True
+        else:
+            fail = random.random() < FAIL_RATE
+        if fail:
+            _counters["failed"] += 1
+    if fail:
+        return jsonify({"error": "Service Unavailable"}), 503
+    return None
+
+
+@app.post("/web/session/authenticate")
+def authenticate():
+    if LATENCY:
+        time.sleep(LATENCY)
+    failure = _injected_failure()
+    if failure:
+        return failure
+
+    params = (request.get_json(silent=True) or {}).get("params", {})
+    if not params.get("login") or not params.get("password"):
+        return _error(200, "odoo.exceptions.AccessDenied", "Access Denied")
+
+    session_id = uuid.uuid4().hex
+    with _lock:
+        _sessions[session_id] = time.time() + SESSION_TTL
+        _counters["authenticate"] += 1
+    resp = jsonify({"jsonrpc": "2.0", "id": 1, "result": {"uid": 2, "db": params.get("db"), "session_id": session_id}})
+    resp.set_cookie("session_id", session_id)
+    return resp
+
+
+@app.post("/web/dataset/call_kw")
+def call_kw():
+    if LATENCY:
+        time.sleep(LATENCY)
+    failure = _injected_failure()
+    if failure:
+        return failure
+
+    session_id = request.cookies.get("session_id", "")
+    with _lock:
+        expires = _sessions.get(session_id)
+    if expires is None or expires < time.time():
+        return _error(100, "odoo.http.SessionExpiredException", "Session expired")
+
+    params = (request.get_json(silent=True) or {}).get("params", {})
+    model, method, args = params.get("model"), params.get("method"), params.get("args") or []
+    if model != "ir.attachment":
+        return _error(200, "builtins.ValueError", f"Unsupported model {model}")
+
+    with _lock:
+        _counters["call_kw"] += 1
+        if method == "create":
+            # Like Odoo, a list of vals creates several records and returns their ids
+            batch = isinstance(args[0], list)
+            ids = []
+            for vals in args[0] if batch else [args[0]]:
+                attachment_id = next(_ids)
+                _store(attachment_id, vals)
+                ids.append(attachment_id)
+            if _faults["lose_next_create"] > 0:
+                _faults["lose_next_create"] -= 1
+                _counters["failed"] += 1
+                return jsonify({"error": "Bad Gateway"}), 502
+            return jsonify({"jsonrpc": "2.0", "id": 1, "result": ids if batch else ids[0]})
+        if method == "write":
+            ids, vals = args
+            for attachment_id in ids:
+                _store(attachment_id, vals)
+            return jsonify({"jsonrpc": "2.0", "id": 1, "result": True})
+        if method == "search_read":
+            kwargs = params.get("kwargs") or {}
+            fields = kwargs.get("fields") or ["id", "name", "checksum"]
+            found = [a for a in _attachments.values() if _matches(a, args[0])]
+            found.sort(key=lambda a: a["id"], reverse=kwargs.get("order") == "id desc")
+            result = [{f: a.get(f, False) for f in fields} for a in found]
+            return jsonify({"jsonrpc": "2.0", "id": 1, "result": result})
+    return _error(200, "builtins.AttributeError", f"Unsupported method {method}")
+
+
+@app.post("/mock/faults")
+def faults():
+    body = request.get_json(silent=True) or {}
+    with _lock:
+        _faults["fail_next"] = int(body.get("fail_next", _faults["fail_next"]))
+        _faults["lose_next_create"] = int(body.get("lose_next_create", _faults["lose_next_create"]))
+        if body.get("expire_sessions"):
+            _sessions.clear()
+    return jsonify(_faults)
+
+
+@app.post("/mock/reset")
+def reset():
+    with _lock:
+        _attachments.clear()
+        _sessions.clear()
+    return jsonify({"status": "ok"})
+
+
+@app.get("/mock/state")
+def state():
+    with _lock:
+        return jsonify({
+            **_counters,
+            "sessions": len(_sessions),
+            "attachments": [
+                {k: v for k, v in a.items() if k != "datas"} | {"size": len(a.get("datas", ""))}
+                for a in _attachments.values()
+            ],
+        })
+
+
+if __name__ == "__main__":
+    app.run(host="127.0.0.1", port=int(os.getenv("MOCK_ODOO_PORT", "8069")), threaded=True)
@@ -0,0 +1,223 @@
+# ocr_engine.py
+import atexit
+import os
+import shlex
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except Exception:  # noqa: BLE001 keep optional import
+    tesserocr = None
+
+from raster import as_tesseract_input
+
+_BYTES_PER_PIXEL = {"L": 1, "RGB": 3, "RGBA": 4}
+
+
+def parse_config(config: str) -> tuple[int | None, dict[str, str]]:
+    """
+    Splits a tesseract CLI config ("--psm 6 -c key=value") into the page
+    segmentation mode and the -c variables.
+    """
+    psm = None
+    variables = {}
+    args = shlex.split(config or "")
+    i = 0
+    while i < len(args):
+        if args[i] == "--psm" and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 2
+        elif args[i] == "-c" and i + 1 < len(args):
+            key, _, value = args[i + 1].partition("=")
+            variables[key] = value
+            i += 2
+        else:
+            i += 1
+    return psm, variables
+
+
+def _with_dpi(config: str, dpi: int | None) -> str:
+    # PPM/PGM files carry no resolution, so hand it to the CLI instead
+    return f"--dpi {dpi} {config}".strip() if dpi else config
+
+
+@dataclass
+class OcrResult:
+    text: str
+    confidence: float | None  # mean word confidence, 0-100
+
+
+class OcrEngine(ABC):
+    """
+    dpi is the resolution the image was rendered at; Tesseract uses it to
+    size its text detection, so it is always passed on when known.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def image_to_string(self, img: Image.Image, config: str = "", dpi: int | None = None) -> str:
+        ...
+
+    @abstractmethod
+    def recognize(self, img: Image.Image, config: str = "", dpi: int | None = None) -> OcrResult:
+        """Text plus mean word confidence from a single recognition pass."""
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Spawns the tesseract CLI for every call; always available."""
+
+    name = "pytesseract"
+
+    def image_to_string(self, img: Image.Image, config: str = "", dpi: int | None = None) -> str:
+        return pytesseract.image_to_string(as_tesseract_input(img), config=_with_dpi(config, dpi))
+
+    def recognize(self, img: Image.Image, config: str = "", dpi: int | None = None) -> OcrResult:
+        data = pytesseract.image_to_data(
+            as_tesseract_input(img), config=_with_dpi(config, dpi), output_type=pytesseract.Output.DICT
+        )
+        # Rebuild the text line by line from the word boxes so one tesseract
+        # run gives both the text and the confidences.
+        lines = {}
+        confidences = []
+        for i, word in enumerate(data["text"]):
+            conf = float(data["conf"][i])
+            if conf < 0 or not word.strip():
+                continue
+            confidences.append(conf)
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append(word)
+        text = "\n".join(" ".join(words) for words in lines.values())
+        confidence = sum(confidences) / len(confidences) if confidences else None
+        return OcrResult(text, confidence)
+
+
+class TesserocrEngine(OcrEngine):
+    """
+    Keeps Tesseract loaded in-process through its C API. One API handle is
+    kept per distinct config, so the language model is loaded once and
+    psm/whitelist settings never leak between full-page and heading OCR.
+    Handles are not thread-safe; get_engine() gives each thread its own.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str = "eng"):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.lang = lang
+        self._apis = {}
+
+    def _api(self, config: str):
+        api = self._apis.get(config)
+        if api is None:
+            psm, variables = parse_config(config)
+            api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            if psm is not None:
+                api.SetPageSegMode(psm)
+            for key, value in variables.items():
+                api.SetVariable(key, value)
+            self._apis[config] = api
+        return api
+
+    def _set_image(self, api, img: Image.Image, dpi: int | None):
+        if img.mode not in _BYTES_PER_PIXEL:
+            img = img.convert("RGB")
+        bpp = _BYTES_PER_PIXEL[img.mode]
+        # Raw samples straight into Tesseract, no image codec in between
+        api.SetImageBytes(img.tobytes(), img.width, img.height, bpp, img.width * bpp)
+        if dpi:
+            # Raw bytes carry no resolution; without this Tesseract guesses
+            api.SetSourceResolution(dpi)
+
+    def image_to_string(self, img: Image.Image, config: str = "", dpi: int | None = None) -> str:
+        api = self._api(config)
+        self._set_image(api, img, dpi)
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    def recognize(self, img: Image.Image, config: str = "", dpi: int | None = None) -> OcrResult:
+        api = self._api(config)
+        self._set_image(api, img, dpi)
+        try:
+            text = api.GetUTF8Text()
+            # MeanTextConf reuses the recognition GetUTF8Text just ran
+            return OcrResult(text, float(api.MeanTextConf()) if text.strip() else None)
+        finally:
+            api.Clear()
+
+    def close(self):
+        for api in self._apis.values():
+            api.End()
+        self._apis.clear()
+
+
+_resolved_backend: str | None = None
+_resolve_lock = threading.Lock()
+
+
+def backend_name() -> str:
+    """
+    The backend OCR actually runs on: tesserocr by default when it is
+    installed and can load the language, pytesseract otherwise. Cache and
+    page index keys use this, so a fallback never passes for tesserocr.
+    """
+    global _resolved_backend
+    with _resolve_lock:
+        if _resolved_backend is None:
+            default = "tesserocr" if tesserocr is not None else "pytesseract"
+            name = os.getenv("OCR_BACKEND", default).lower()
+            if name == "tesserocr":
+                try:
+                    TesserocrEngine(lang=os.getenv("OCR_LANG", "eng"))._api("").End()
+                except Exception as exc:  # noqa: BLE001 fall back so OCR keeps working
+                    print(f"Warning: tesserocr backend unavailable ({exc}); using pytesseract")
+                    name = "pytesseract"
+            _resolved_backend = name
+        return _resolved_backend
+
+
+_local = threading.local()
+# Every thread's engine, so handles of finished threads can be released
+_engines: list[tuple[threading.Thread, OcrEngine]] = []
+_engines_lock = threading.Lock()
+
+
+def get_engine() -> OcrEngine:
+    """
+    The calling thread's engine. Pool workers are single-threaded, so this
+    is one engine per worker process, reused across pages and jobs.
+    """
+    engine = getattr(_local, "engine", None)
+    if engine is None:
+        if backend_name() == "tesserocr":
+            engine = TesserocrEngine(lang=os.getenv("OCR_LANG", "eng"))
+        else:
+            engine = PytesseractEngine()
+        _local.engine = engine
+        with _engines_lock:
+            dead = [e for t, e in _engines if not t.is_alive()]
+            _engines[:] = [(t, e) for t, e in _engines if t.is_alive()]
+            _engines.append((threading.current_thread(), engine))
+        for e in dead:
+            e.close()
+    return engine
+
+
+@atexit.register
+def close_engines():
+    with _engines_lock:
+        engines = [e for _, e in _engines]
+        _engines.clear()
+    for e in engines:
+        e.close()
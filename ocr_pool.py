@@ -0,0 +1,92 @@
+# ocr_pool.py
+import math
+import multiprocessing
+import os
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may actually use: its affinity mask, further capped
+    by a cgroup CPU quota. os.cpu_count() is the host's count, which in a
+    container is usually far more than the quota allows.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+def _cgroup_cpu_quota() -> float | None:
+    try:
+        # cgroup v2: "<quota> <period>", quota "max" when unlimited
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: quota -1 when unlimited
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def pool_size() -> int:
+    # OCR_WORKERS is capped at the usable CPUs so concurrent jobs sharing the
+    # pool can never run more Tesseract processes than the container has cores.
+    cpus = available_cpus()
+    raw = os.getenv("OCR_WORKERS")
+    requested = int(raw) if raw else cpus
+    return max(1, min(requested, cpus))
+
+
+def _init_worker():
+    # Tesseract spawns its own OpenMP threads per process; with one process
+    # per core that only adds contention.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def get_pool() -> ProcessPoolExecutor | None:
+    """
+    Returns the process pool shared by every job, or None when OCR_WORKERS
+    is 1 and pages should be OCR'd inline. A pool broken by a dead worker
+    is replaced, so one crash doesn't fail every later job.
+    """
+    global _pool
+
+    size = pool_size()
+    if size <= 1:
+        return None
+
+    with _pool_lock:
+        if _pool is not None and _pool._broken:
+            print(f"OCR process pool is broken ({_pool._broken}); starting a new one")
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def shutdown_pool(wait: bool = True):
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
@@ -1,10 +1,18 @@
 import base64
+import hashlib
+import json
+import mmap
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 @dataclass
@@ -51,96 +59,527 @@ class OdooConfig:
         )
 
 
+class OdooError(Exception):
+    """A JSON-RPC error or HTTP failure from Odoo."""
+
+    def __init__(
+        self,
+        message: str,
+        retryable: bool = False,
+        session_expired: bool = False,
+        retry_after: float | None = None,
+        maybe_applied: bool = False,
+    ):
+        super().__init__(message)
+        self.retryable = retryable
+        self.session_expired = session_expired
+        self.retry_after = retry_after
+        # The request may have been carried out even though it failed, so
+        # sending it again can repeat it
+        self.maybe_applied = maybe_applied
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Odoo (or the proxy in front of it) refused these before doing anything
+NOT_APPLIED_STATUS = {429, 503}
+
+
+def _scope_tag(scope: str) -> str:
+    return f"contract:{scope}"
+
+
+@dataclass
+class UploadOutcome:
+    attachment_id: int
+    action: str  # created, updated or unchanged
+    size: int
+
+
+def _retry_after(resp) -> float | None:
+    try:
+        return float(resp.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    # Exponential backoff with full jitter, so parallel uploads that failed
+    # together don't retry in lockstep
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+B64_CHUNK = 3 * 256 * 1024  # multiple of 3, so chunks encode without padding
+
+
+class AttachmentBody:
+    """
+    JSON-RPC body for ir.attachment.create with a list of vals, or for
+    write(write_ids, vals) with a single vals. Each file's
+    base64 is produced chunk by chunk while the request is sent, never as
+    one string. The length is known up front, so no chunked transfer
+    encoding is needed, and the body can be iterated again on retry.
+    """
+
+    def __init__(self, records: list[tuple[dict, Any]], write_ids: list[int] | None = None):
+        self.records = records
+        envelope = {
+            "jsonrpc": "2.0",
+            "method": "call",
+            "id": 1,
+            "params": {
+                "model": "ir.attachment",
+                "method": "create" if write_ids is None else "write",
+                "kwargs": {},
+                "context": {},
+            },
+        }
+        # Splice the args in as the last key of params
+        if write_ids is None:
+            args_head, self._tail = ', "args": [[', b"]]}}"
+        else:
+            args_head, self._tail = f', "args": [{json.dumps(write_ids)}, ', b"]}}"
+        self._head = (json.dumps(envelope)[:-2] + args_head).encode("utf-8")
+        self._prefixes = [
+            (json.dumps(vals)[:-1] + (", " if vals else "") + '"datas": "').encode("utf-8")
+            for vals, _ in records
+        ]
+
+    def __len__(self) -> int:
+        total = len(self._head) + len(self._tail) + 2 * max(0, len(self.records) - 1)
+        for prefix, (_, data) in zip(self._prefixes, self.records):
+            total += len(prefix) + 4 * ((len(data) + 2) // 3) + 2
+        return total
+
+    def __iter__(self):
+        yield self._head
+        for i, (prefix, (_, data)) in enumerate(zip(self._prefixes, self.records)):
+            if i:
+                yield b", "
+            yield prefix
+            with memoryview(data) as view:  # released before the mmap closes
+                for start in range(0, len(view), B64_CHUNK):
+                    yield base64.b64encode(view[start:start + B64_CHUNK])
+            yield b'"}'
+        yield self._tail
+
+
 class OdooClient:
+    """
+    Long-lived, thread-safe JSON-RPC client. The HTTP session is pooled and
+    shared by all threads; Odoo's session cookie is obtained once and only
+    renewed when Odoo reports it expired.
+    """
+
     def __init__(self, config: OdooConfig):
         self.config = config
+        self.timeout = float(os.getenv("ODOO_TIMEOUT", "60"))
+        self.max_attempts = max(1, int(os.getenv("ODOO_RETRY_ATTEMPTS", "4")))
+        self.backoff_base = float(os.getenv("ODOO_BACKOFF_BASE", "0.5"))
+        self.backoff_cap = float(os.getenv("ODOO_BACKOFF_CAP", "10"))
+        self.batch_max_bytes = int(os.getenv("ODOO_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.skip_unchanged = os.getenv("ODOO_SKIP_UNCHANGED", "true").lower() != "false"
+        # A changed PDF overwrites its attachment; set to false to upload it
+        # next to the old one instead
+        self.update_in_place = os.getenv("ODOO_UPDATE_IN_PLACE", "true").lower() != "false"
+
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(os.getenv("ODOO_POOL_SIZE", "8")))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.verify = config.verify_ssl
         if config.auth_token:
             self.session.headers.update({"Authorization": f"Bearer {config.auth_token}"})
 
-    def authenticate(self):
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "call",
-            "params": {
+        self._auth_lock = threading.Lock()
+        self._auth_result = None
+        self._auth_generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="odoo-upload")
+        # Lookup and create for one contract must not interleave with another
+        # upload of the same contract; striped so the set of locks stays fixed
+        self._scope_locks = [threading.Lock() for _ in range(64)]
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        # Managed by leased_client() under _client_lock
+        self._leases = 0
+        self._retired = False
+        self._counters = {
+            "requests": 0,
+            "retries": 0,
+            "reauthentications": 0,
+            "uploaded_bytes": 0,
+            "skipped_bytes": 0,
+        }
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._counters[name] += amount
+            # Also charge it to the upload_files() call this thread works for
+            tally = getattr(self._local, "tally", None)
+            if tally is not None:
+                tally[name] = tally.get(name, 0) + amount
+
+    def _tallied(self, tally: dict | None, func, *args):
+        previous = getattr(self._local, "tally", None)
+        self._local.tally = tally
+        try:
+            return func(*args)
+        finally:
+            self._local.tally = previous
+
+    def _post(self, path: str, params: dict | None = None, body=None):
+        if body is None:
+            send = {"json": {"jsonrpc": "2.0", "method": "call", "params": params, "id": 1}}
+        else:
+            send = {"data": body, "headers": {"Content-Type": "application/json"}}
+        self._count("requests")
+        try:
+            resp = self.session.post(f"{self.config.url}{path}", timeout=self.timeout, **send)
+        except requests.ConnectTimeout as exc:
+            raise OdooError(f"{path}: {exc}", retryable=True) from exc
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            # Includes read timeouts and dropped connections, after the
+            # request may have been received
+            raise OdooError(f"{path}: {exc}", retryable=True, maybe_applied=True) from exc
+
+        if resp.status_code in RETRYABLE_STATUS:
+            raise OdooError(
+                f"{path}: HTTP {resp.status_code}",
+                retryable=True,
+                retry_after=_retry_after(resp),
+                maybe_applied=resp.status_code not in NOT_APPLIED_STATUS,
+            )
+        if resp.status_code in (401, 403):
+            raise OdooError(f"{path}: HTTP {resp.status_code}", session_expired=True)
+        if resp.status_code >= 400:
+            raise OdooError(f"{path}: HTTP {resp.status_code}")
+
+        data = resp.json()
+        error = data.get("error")
+        if error:
+            name = (error.get("data") or {}).get("name", "")
+            message = (error.get("data") or {}).get("message") or error.get("message", "Odoo error")
+            expired = error.get("code") == 100 or name.endswith("SessionExpiredException")
+            raise OdooError(f"{path}: {message}", session_expired=expired)
+        return data.get("result")
+
+    def _retrying(self, func, idempotent: bool = True):
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except OdooError as exc:
+                attempt += 1
+                if not exc.retryable or attempt >= self.max_attempts:
+                    raise
+                if exc.maybe_applied and not idempotent:
+                    raise
+                delay = _backoff(attempt - 1, self.backoff_base, self.backoff_cap)
+                if exc.retry_after is not None:
+                    delay = max(delay, min(exc.retry_after, self.backoff_cap))
+                self._count("retries")
+                print(f"Attempt {attempt}/{self.max_attempts} failed: {exc}; retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def authenticate(self, force: bool = False):
+        with self._auth_lock:
+            if self._auth_result is not None and not force:
+                return self._auth_result
+            params = {
                 "db": self.config.db,
                 "login": self.config.username,
                 "password": self.config.password,
-            },
-            "id": 1,
+            }
+            result = self._retrying(lambda: self._post("/web/session/authenticate", params))
+            # Odoo returns session in result; mock service mirrors this
+            self._auth_result = result or {}
+            self._auth_generation += 1
+            return self._auth_result
+
+    def _reauthenticate(self, generation: int):
+        # Threads that hit the same expired session only log in once
+        with self._auth_lock:
+            if generation != self._auth_generation:
+                return
+            self._auth_result = None
+        self._count("reauthentications")
+        print("Odoo session expired; re-authenticating...")
+        self.authenticate()
+
+    def _with_session(self, send, idempotent: bool = True):
+        # A request that finds the session expired logs in again and is
+        # resent once
+        self.authenticate()
+        for renewed in (False, True):
+            generation = self._auth_generation
+            try:
+                return self._retrying(send, idempotent)
+            except OdooError as exc:
+                if not exc.session_expired or renewed:
+                    raise
+                self._reauthenticate(generation)
+
+    def call_kw(self, model: str, method: str, args: list, kwargs: dict | None = None):
+        params = {
+            "model": model,
+            "method": method,
+            "args": args,
+            "kwargs": kwargs or {},
+            "context": {},
         }
-        resp = self.session.post(f"{self.config.url}/web/session/authenticate", json=payload, verify=self.config.verify_ssl)
-        resp.raise_for_status()
-        data = resp.json()
-        # Odoo returns session in result; mock service mirrors this
-        return data.get("result", {})
+        return self._with_session(lambda: self._post("/web/dataset/call_kw", params))
 
-    def upload_attachment(self, name: str, file_bytes: bytes, mimetype: str = "application/pdf") -> Any:
-        b64 = base64.b64encode(file_bytes).decode("ascii")
+    def _attachment_vals(self, name: str, mimetype: str, scope: str | None = None) -> dict:
         vals = {
             "name": name,
-            "datas": b64,
             "mimetype": mimetype,
             "type": "binary",
         }
+        if scope:
+            vals["description"] = _scope_tag(scope)
         if self.config.folder_path:
             vals["folder_path"] = self.config.folder_path
         if self.config.parent_id is not None:
             vals["parent_id"] = self.config.parent_id
+        return vals
 
-        payload = {
-            "jsonrpc": "2.0",
-            "method": "call",
-            "params": {
-                "model": "ir.attachment",
-                "method": "create",
-                "args": [vals],
-                "kwargs": {},
-                "context": {},
-            },
-            "id": 1,
-        }
-        resp = self.session.post(f"{self.config.url}/web/dataset/call_kw", json=payload, verify=self.config.verify_ssl)
-        resp.raise_for_status()
-        return resp.json().get("result")
+    def create_attachments(
+        self,
+        files: list[tuple[str, Any]],
+        mimetype: str = "application/pdf",
+        scope: str | None = None,
+    ) -> list:
+        """
+        Creates one attachment per (name, bytes-like) in a single
+        ir.attachment.create call and returns the new ids in order. scope
+        tags the attachments with the contract they belong to.
+
+        A create is only resent when Odoo cannot have carried it out; a
+        failure after it may have (read timeout, 502, 504) raises an
+        OdooError with maybe_applied set.
+        """
+        body = AttachmentBody([(self._attachment_vals(name, mimetype, scope), data) for name, data in files])
+        result = self._with_session(lambda: self._post("/web/dataset/call_kw", body=body), idempotent=False)
+        return result if isinstance(result, list) else [result]
 
+    def upload_attachment(self, name: str, file_bytes: bytes, mimetype: str = "application/pdf") -> Any:
+        return self.create_attachments([(name, file_bytes)], mimetype)[0]
 
-def upload_pdfs_to_odoo(quantity_path: str, price_path: str):
+    def update_attachment(self, attachment_id: int, file_bytes: Any, mimetype: str = "application/pdf"):
+        body = AttachmentBody([({"mimetype": mimetype}, file_bytes)], write_ids=[attachment_id])
+        return self._with_session(lambda: self._post("/web/dataset/call_kw", body=body))
+
+    def existing_attachments(self, names: list[str], scope: str) -> Dict[str, list[dict]]:
+        """
+        {name: [{id, name, checksum}, ...]} for this contract's attachments
+        with these names in the configured folder/parent, newest first. Only
+        metadata is read, never the file contents.
+        """
+        domain = [["name", "in", names], ["type", "=", "binary"], ["description", "=", _scope_tag(scope)]]
+        if self.config.folder_path:
+            domain.append(["folder_path", "=", self.config.folder_path])
+        if self.config.parent_id is not None:
+            domain.append(["parent_id", "=", self.config.parent_id])
+        records = self.call_kw(
+            "ir.attachment",
+            "search_read",
+            [domain],
+            {"fields": ["id", "name", "checksum"], "order": "id desc"},
+        )
+        existing = {}
+        for record in records or []:
+            existing.setdefault(record["name"], []).append(record)
+        return existing
+
+    def upload_files(
+        self,
+        files: Dict[str, tuple[str, Any]],
+        tally: dict | None = None,
+        scope: str | None = None,
+    ) -> Dict[str, UploadOutcome]:
+        """
+        Uploads {key: (attachment_name, path or bytes)} and returns
+        {key: outcome}.
+        Files are grouped into batches of up to ODOO_BATCH_MAX_BYTES, one
+        create call per batch, and batches run concurrently.
+
+        scope identifies the contract the files belong to. Only with a
+        scope are existing attachments looked at, and only that contract's:
+        a file already there with the same checksum is skipped, and one
+        whose content changed is updated in place unless ODOO_UPDATE_IN_PLACE
+        is false (then it is uploaded alongside). tally, when given, collects
+        this call's share of the client counters (requests, retries, bytes).
+        """
+        batches = []
+        batch_bytes = 0
+        for key, (name, source) in files.items():
+            size = os.path.getsize(source) if isinstance(source, (str, os.PathLike)) else len(source)
+            if not batches or batch_bytes + size > self.batch_max_bytes:
+                batches.append([])
+                batch_bytes = 0
+            batches[-1].append((key, name, source))
+            batch_bytes += size
+
+        self._tallied(tally, self.authenticate)
+        futures = [self._executor.submit(self._tallied, tally, self._upload_batch, batch, scope) for batch in batches]
+        results = {}
+        for future in futures:
+            results.update(future.result())
+        return results
+
+    def _upload_batch(self, batch: list[tuple[str, str, Any]], scope: str | None = None) -> Dict[str, UploadOutcome]:
+        if scope is None or not self.skip_unchanged:
+            return self._upload_scoped(batch, scope, {})
+        with self._scope_locks[hash(scope) % len(self._scope_locks)]:
+            existing = self.existing_attachments([name for _, name, _ in batch], scope)
+            return self._upload_scoped(batch, scope, existing)
+
+    def _upload_scoped(self, batch: list[tuple[str, str, Any]], scope: str | None, existing: dict) -> Dict[str, UploadOutcome]:
+        outcomes = {}
+        with ExitStack() as stack:
+            to_create = []
+            for key, name, source in batch:
+                if isinstance(source, (str, os.PathLike)):
+                    f = stack.enter_context(open(source, "rb"))
+                    # Memory-mapped, so the upload encodes straight from the page cache
+                    data = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) if os.path.getsize(source) else b""
+                else:
+                    data = source
+                records = existing.get(name)
+                if not records:
+                    to_create.append((key, name, data))
+                    continue
+
+                # Odoo stores the SHA-1 of the raw file as ir.attachment.checksum
+                checksum = hashlib.sha1(data).hexdigest()
+                same = next((r for r in records if r.get("checksum") == checksum), None)
+                if same is not None:
+                    outcomes[key] = UploadOutcome(same["id"], "unchanged", len(data))
+                    self._count("skipped_bytes", len(data))
+                elif not self.update_in_place:
+                    to_create.append((key, name, data))
+                else:
+                    self.update_attachment(records[0]["id"], data)
+                    outcomes[key] = UploadOutcome(records[0]["id"], "updated", len(data))
+                    self._count("uploaded_bytes", len(data))
+
+            if to_create:
+                ids = self._create_scoped(to_create, scope, existing)
+                for (key, _, data), attachment_id in zip(to_create, ids):
+                    outcomes[key] = UploadOutcome(attachment_id, "created", len(data))
+                    self._count("uploaded_bytes", len(data))
+        return outcomes
+
+    def _create_scoped(self, to_create: list[tuple[str, str, Any]], scope: str | None, existing: dict) -> list:
+        try:
+            return self.create_attachments([(name, data) for _, name, data in to_create], scope=scope)
+        except OdooError as exc:
+            # Only a locked, scoped upload can tell its own new attachments
+            # from everything else
+            if not exc.maybe_applied or scope is None or not self.skip_unchanged:
+                raise
+            print(f"Attachment create may have gone through ({exc}); checking before resending")
+
+        # Files already there before this upload are not the ones just sent
+        known = {r["id"] for records in existing.values() for r in records}
+        found = self.existing_attachments(sorted({name for _, name, _ in to_create}), scope)
+        ids = [None] * len(to_create)
+        missing = []
+        for i, (_, name, data) in enumerate(to_create):
+            checksum = hashlib.sha1(data).hexdigest()
+            match = next((r for r in found.get(name, []) if r["id"] not in known and r.get("checksum") == checksum), None)
+            if match is None:
+                missing.append(i)
+            else:
+                ids[i] = match["id"]
+                known.add(match["id"])
+        if missing:
+            created = self.create_attachments([(to_create[i][1], to_create[i][2]) for i in missing], scope=scope)
+            for i, attachment_id in zip(missing, created):
+                ids[i] = attachment_id
+        return ids
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._counters)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_client: OdooClient | None = None
+_client_lock = threading.Lock()
+
+
+def _current_client() -> OdooClient:
+    # Caller holds _client_lock
+    global _client
     config = OdooConfig.from_env()
-    client = OdooClient(config)
+    if _client is None or _client.config != config:
+        if _client is not None:
+            _client._retired = True
+        _client = OdooClient(config)
+    return _client
 
-    print("Authenticating with Odoo...")
-    client.authenticate()
 
-    def _retry(func, attempts=3, delay=1.5):
-        last_err = None
-        for i in range(attempts):
-            try:
-                return func()
-            except Exception as exc:  # noqa: BLE001 keep broad for retries
-                last_err = exc
-                print(f"Attempt {i + 1}/{attempts} failed: {exc}")
-                time.sleep(delay)
-        raise last_err
+def get_client() -> OdooClient:
+    """
+    Shared client for the process. Raises ValueError when the Odoo env vars
+    are missing; a changed config replaces the client. Anything longer than
+    a single call should use leased_client(), since a replaced client is
+    closed once its last lease ends.
+    """
+    with _client_lock:
+        return _current_client()
 
-    with open(quantity_path, "rb") as f:
-        qty_bytes = f.read()
-    with open(price_path, "rb") as f:
-        price_bytes = f.read()
 
-    print("Uploading quantity PDF to Odoo...")
-    qty_result = _retry(lambda: client.upload_attachment("roof_scope_quantity.pdf", qty_bytes))
-    print(f"Quantity PDF upload result: {qty_result}")
+@contextmanager
+def leased_client():
+    """
+    The shared client, kept open until the block ends even if a config
+    change replaces it meanwhile; the last lease on a replaced client
+    closes it.
+    """
+    with _client_lock:
+        client = _current_client()
+        client._leases += 1
+    try:
+        yield client
+    finally:
+        with _client_lock:
+            client._leases -= 1
+            stale = client._retired and client._leases == 0
+        if stale:
+            client.close()
 
-    print("Uploading price PDF to Odoo...")
-    price_result = _retry(lambda: client.upload_attachment("roof_scope_price.pdf", price_bytes))
-    print(f"Price PDF upload result: {price_result}")
 
-    return {"quantity": qty_result, "price": price_result}
+def upload_pdfs_to_odoo(quantity_pdf: str | bytes, price_pdf: str | bytes, scope: str | None = None):
+    """
+    Uploads both summaries, each given as a file path or as PDF bytes.
+    scope identifies the contract (see contract_scope()); without one
+    nothing is deduplicated.
+    """
+    print("Uploading quantity and price PDFs to Odoo...")
+    tally = {}
+    with leased_client() as client:
+        outcomes = client.upload_files({
+            "quantity": ("roof_scope_quantity.pdf", quantity_pdf),
+            "price": ("roof_scope_price.pdf", price_pdf),
+        }, tally=tally, scope=scope)
+    for key, outcome in outcomes.items():
+        print(f"{key.capitalize()} PDF upload result: {outcome.action} (id {outcome.attachment_id})")
+    return {
+        "quantity": outcomes["quantity"].attachment_id,
+        "price": outcomes["price"].attachment_id,
+        "actions": {key: outcome.action for key, outcome in outcomes.items()},
+        "skipped_bytes": sum(o.size for o in outcomes.values() if o.action == "unchanged"),
+        "uploaded_bytes": tally.get("uploaded_bytes", 0),
+        "requests": tally.get("requests", 0),
+        "retries": tally.get("retries", 0),
+    }
 
 
 def ping_odoo():
-    config = OdooConfig.from_env()
-    client = OdooClient(config)
-    print("Pinging Odoo (auth only)...")
-    return client.authenticate()
+    with leased_client() as client:
+        print("Pinging Odoo (auth only)...")
+        return client.authenticate(force=True)
@@ -0,0 +1,188 @@
+# page_index.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# "/Name 12 0 R" entries of an XObject resource dictionary
+_XOBJECT_REF = re.compile(r"/[^\s/<>\[\]()]+\s*(\d+)\s+\d+\s+R")
+
+
+def _xobject_xrefs(doc, xref: int) -> list[int]:
+    kind, value = doc.xref_get_key(xref, "Resources/XObject")
+    if kind == "xref":
+        value = doc.xref_object(int(value.split()[0]), compressed=True)
+    elif kind != "dict":
+        return []
+    return [int(ref) for ref in _XOBJECT_REF.findall(value)]
+
+
+def _hash_xobjects(doc, xrefs, h, seen: set):
+    # Form XObjects carry their own content (show_pdf_page pages are a
+    # single "/fzFrm0 Do"), so each form's stream and everything it draws
+    # is hashed, not just its name
+    for xref in xrefs:
+        if xref in seen:
+            continue
+        seen.add(xref)
+        h.update(hashlib.sha256(doc.xref_stream_raw(xref) or b"").digest())
+        if doc.xref_get_key(xref, "Subtype")[1] == "/Form":
+            _hash_xobjects(doc, _xobject_xrefs(doc, xref), h, seen)
+
+
+def page_fingerprint(doc, page) -> str | None:
+    """
+    Identifies a page by what it draws: its content streams, the fonts it
+    uses, every image and form XObject it places (forms recursively) and
+    the appearance of its annotations. Two contracts sharing a boilerplate
+    page produce the same fingerprint; a photo page with the same layout
+    but different photos does not. Pages with form fields get None and are
+    never indexed, since what a widget shows depends on its value, not just
+    its appearance.
+    """
+    if page.first_widget is not None:
+        return None
+    h = hashlib.sha256()
+    h.update(f"{page.rect.width:.1f}x{page.rect.height:.1f}".encode("ascii"))
+    h.update(page.read_contents())
+    for font in page.get_fonts(full=True):
+        h.update(str(font[3]).encode("utf-8", "replace"))  # basefont incl. subset tag
+    xrefs = [info[0] for info in page.get_images(full=True)]
+    xrefs += [info[0] for info in page.get_xobjects()]
+    xrefs += _xobject_xrefs(doc, page.xref)
+    _hash_xobjects(doc, dict.fromkeys(xrefs), h, set())
+    for annot in page.annots():
+        h.update(f"{annot.type[1]}:{tuple(round(v, 1) for v in annot.rect)}".encode("ascii"))
+        kind, value = doc.xref_get_key(annot.xref, "AP/N")
+        if kind == "xref":
+            _hash_xobjects(doc, [int(value.split()[0])], h, set())
+        else:
+            # No normal appearance stream: the dictionary is all there is
+            h.update(doc.xref_object(annot.xref, compressed=True).encode("utf-8", "replace"))
+    return h.hexdigest()
+
+
+class PageIndex:
+    """
+    Persistent map from page fingerprint to the text OCR produced for it.
+    Known pages skip Tesseract.
+    """
+
+    # Bumped whenever the table changes; an older index is simply rebuilt
+    # (3: fingerprints include form XObjects, so older entries may be wrong)
+    SCHEMA_VERSION = 3
+    # Stores between trims of the least recently used pages
+    TRIM_INTERVAL = 200
+
+    def __init__(self, path: Path, max_entries: int):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counters = {"lookups": 0, "hits": 0, "stores": 0}
+        self._stores_since_trim = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS pages")
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    fingerprint TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    settings TEXT NOT NULL,
+                    lines TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (fingerprint, mode, settings)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)")
+        self.trim()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=Path(os.getenv("PAGE_INDEX_PATH", "cache/page_index.sqlite3")),
+            max_entries=int(os.getenv("PAGE_INDEX_MAX_ENTRIES", "20000")),
+        )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:  # commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def lookup(self, fingerprint: str, mode: str, settings: str) -> list[str] | None:
+        with self._lock, self._connect() as conn:
+            self._counters["lookups"] += 1
+            row = conn.execute(
+                "SELECT lines FROM pages WHERE fingerprint = ? AND mode = ? AND settings = ?",
+                (fingerprint, mode, settings),
+            ).fetchone()
+            if row is None:
+                return None
+            self._counters["hits"] += 1
+            conn.execute(
+                "UPDATE pages SET hits = hits + 1, last_used = ? "
+                "WHERE fingerprint = ? AND mode = ? AND settings = ?",
+                (time.time(), fingerprint, mode, settings),
+            )
+            return json.loads(row[0])
+
+    def store(self, fingerprint: str, mode: str, settings: str, lines: list[str]):
+        with self._lock, self._connect() as conn:
+            self._counters["stores"] += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (fingerprint, mode, settings, lines, hits, last_used) "
+                "VALUES (?, ?, ?, ?, 0, ?)",
+                (fingerprint, mode, settings, json.dumps(lines), time.time()),
+            )
+            self._stores_since_trim += 1
+            if self._stores_since_trim >= self.TRIM_INTERVAL:
+                self._trim(conn)
+
+    def trim(self):
+        with self._lock, self._connect() as conn:
+            self._trim(conn)
+
+    def _trim(self, conn):
+        # Least recently used pages go first once the index is full
+        self._stores_since_trim = 0
+        excess = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM pages WHERE rowid IN (SELECT rowid FROM pages ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["hit_rate"] = round(counters["hits"] / counters["lookups"], 4) if counters["lookups"] else None
+        return counters
+
+
+_index: PageIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_page_index() -> PageIndex | None:
+    """Shared index, or None when PAGE_INDEX_ENABLED=false."""
+    global _index
+    if os.getenv("PAGE_INDEX_ENABLED", "true").lower() == "false":
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = PageIndex.from_env()
+        return _index
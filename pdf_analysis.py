@@ -0,0 +1,439 @@
+# pdf_analysis.py
+import os
+import time
+import difflib
+import fitz
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+import re
+
+from ocr_engine import backend_name, get_engine
+from ocr_pool import get_pool, pool_size
+from page_index import get_page_index, page_fingerprint
+from raster import pixmap_to_image, render_page
+
+# Every heading either extractor looks for; a short native text layer that
+# still carries one of these is a real heading page, not a scan (unless an
+# image covers the page, see SCAN_IMAGE_COVERAGE).
+SECTION_HEADINGS = [
+    "INSPECTION",
+    "PREFERRED PACKAGE",
+    "STANDARD SCOPE",
+    "DRY ROT & EXTRA WORK",
+    "AUTHORIZATION PAGE",
+    "OPTIONAL ITEMS",
+]
+
+MIN_NATIVE_CHARS = int(os.getenv("MIN_NATIVE_CHARS", "40"))
+# A page mostly covered by one image is a scan, even with a stamped header or
+# footer in its text layer; only this much native text outweighs the image.
+# Photo pages place several smaller images and keep their native captions.
+SCAN_IMAGE_COVERAGE = float(os.getenv("SCAN_IMAGE_COVERAGE", "0.8"))
+MIN_NATIVE_CHARS_OVER_SCAN = int(os.getenv("MIN_NATIVE_CHARS_OVER_SCAN", "300"))
+
+# Heading classification only OCRs the top band of the page at low DPI,
+# treating it as one uppercase text block.
+HEADING_DPI = int(os.getenv("HEADING_DPI", "100"))
+HEADING_BAND = float(os.getenv("HEADING_BAND", "0.3"))
+HEADING_OCR_CONFIG = "--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ&:"
+# Opt-in: when the band finds no section at all, look again on full pages.
+# That catches headings set lower than HEADING_BAND, but costs full OCR of
+# every scanned page for each contract that simply lacks the section.
+HEADING_FULL_FALLBACK = os.getenv("HEADING_FULL_FALLBACK", "false").lower() == "true"
+
+# Adaptive OCR starts each page at the lowest DPI step and only re-OCRs at
+# the next one when word confidence is low or a heading is a near miss.
+OCR_ADAPTIVE = os.getenv("OCR_ADAPTIVE", "false").lower() == "true"
+ADAPTIVE_DPI_STEPS = [int(d) for d in os.getenv("OCR_ADAPTIVE_DPIS", "100,150,220").split(",")]
+MIN_OCR_CONFIDENCE = float(os.getenv("MIN_OCR_CONFIDENCE", "70"))
+# Below this many words (photo pages, blank pages) confidence says nothing
+MIN_CONFIDENCE_WORDS = 5
+
+
+@dataclass
+class PageText:
+    lines: list[str]
+    source: str  # "native", "ocr", "heading" or "index"
+
+
+def _normalize_lines(text: str) -> list[str]:
+    lines = [re.sub(r"\s+", " ", l).strip() for l in text.splitlines()]
+    return [l for l in lines if l]
+
+def _render_full(page, dpi: int):
+    return pixmap_to_image(render_page(page, dpi, gray=True))
+
+def _render_heading(page, dpi: int, band: float = HEADING_BAND):
+    rect = page.rect
+    clip = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height * band)
+    return pixmap_to_image(render_page(page, dpi, clip=clip, gray=True))
+
+def ocr_lines(page, dpi=150) -> list[str]:
+    img = _render_full(page, dpi)
+    text = get_engine().image_to_string(img, dpi=dpi)
+    return _normalize_lines(text)
+
+def heading_ocr_lines(page, dpi=HEADING_DPI, band=HEADING_BAND) -> list[str]:
+    img = _render_heading(page, dpi, band)
+    text = get_engine().image_to_string(img, config=HEADING_OCR_CONFIG, dpi=dpi)
+    return _normalize_lines(text)
+
+def _ambiguous_heading(lines: list[str]) -> bool:
+    # A short line that is close to, but not exactly, a section heading is
+    # most likely a heading OCR garbled at this resolution.
+    for l in lines:
+        lu = l.upper().strip().strip(":")
+        if len(lu) > 40:
+            continue
+        for h in SECTION_HEADINGS:
+            if lu != h and difflib.SequenceMatcher(None, lu, h).ratio() >= 0.8:
+                return True
+    return False
+
+def adaptive_ocr_lines(page, mode: str) -> tuple[list[str], list[tuple[int, float | None]]]:
+    """
+    Returns the lines and every (dpi, confidence) tried, lowest DPI first.
+    """
+    if mode == "heading":
+        steps, render, config = [HEADING_DPI, 2 * HEADING_DPI], _render_heading, HEADING_OCR_CONFIG
+    else:
+        steps, render, config = ADAPTIVE_DPI_STEPS, _render_full, ""
+
+    decisions = []
+    lines = []
+    for dpi in steps:
+        img = render(page, dpi)
+        result = get_engine().recognize(img, config=config, dpi=dpi)
+        lines = _normalize_lines(result.text)
+        decisions.append((dpi, None if result.confidence is None else round(result.confidence, 1)))
+
+        word_count = sum(len(l.split()) for l in lines)
+        low_confidence = (
+            result.confidence is not None
+            and word_count >= MIN_CONFIDENCE_WORDS
+            and result.confidence < MIN_OCR_CONFIDENCE
+        )
+        if not low_confidence and not _ambiguous_heading(lines):
+            break
+    return lines, decisions
+
+def _timed_ocr(page, mode: str, dpi: int) -> tuple[list[str], float, list]:
+    started = time.perf_counter()
+    if OCR_ADAPTIVE:
+        lines, decisions = adaptive_ocr_lines(page, mode)
+    elif mode == "heading":
+        lines, decisions = heading_ocr_lines(page), [(HEADING_DPI, None)]
+    else:
+        lines, decisions = ocr_lines(page, dpi=dpi), [(dpi, None)]
+    return lines, time.perf_counter() - started, decisions
+
+def file_identity(path: str) -> tuple[str, int, int]:
+    st = os.stat(path)
+    return path, st.st_mtime_ns, st.st_size
+
+# Per-process cache so a pool worker opens each PDF once, not once per page.
+# Keyed on path, mtime and size, since fixed paths like SIGNED_PDF_PATH get
+# new contents between jobs.
+_worker_doc = None
+_worker_doc_id = None
+
+def ocr_page_worker(file_id: tuple, index: int, mode: str, dpi: int) -> tuple[list[str], float, list]:
+    global _worker_doc, _worker_doc_id
+    if _worker_doc_id != file_id:
+        if _worker_doc is not None:
+            _worker_doc.close()
+            _worker_doc, _worker_doc_id = None, None
+        path = file_id[0]
+        doc = fitz.open(path)
+        if file_identity(path) != file_id:
+            doc.close()
+            raise RuntimeError(f"{path} changed while it was being processed")
+        _worker_doc, _worker_doc_id = doc, file_id
+    return _timed_ocr(_worker_doc[index], mode, dpi)
+
+def native_lines(page) -> list[str]:
+    # sort=True gives top-to-bottom reading order, like OCR output
+    return _normalize_lines(page.get_text("text", sort=True))
+
+def image_coverage(page) -> float:
+    """Share of the page area covered by its largest image."""
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    return max((abs(fitz.Rect(info["bbox"]) & page.rect) / area for info in page.get_image_info()), default=0.0)
+
+def _native_usable(page, lines: list[str], headings: list[str]) -> bool:
+    char_count = sum(len(l) for l in lines)
+    if char_count < MIN_NATIVE_CHARS_OVER_SCAN and image_coverage(page) >= SCAN_IMAGE_COVERAGE:
+        return False
+    if char_count >= MIN_NATIVE_CHARS:
+        return True
+    return any(has_heading(lines, h) for h in headings)
+
+def has_heading(lines: list[str], heading: str) -> bool:
+    # Heading must appear as its own line (or extremely close)
+    h = heading.strip().upper()
+    for l in lines:
+        lu = l.upper().strip().strip(":")
+        if lu == h:
+            return True
+    return False
+
+
+def _resolve_flags(use_native_text: bool | None, use_heading_scan: bool | None) -> tuple[bool, bool]:
+    if use_native_text is None:
+        use_native_text = os.getenv("NATIVE_TEXT_ENABLED", "true").lower() != "false"
+    if use_heading_scan is None:
+        use_heading_scan = os.getenv("HEADING_SCAN_ENABLED", "true").lower() != "false"
+    return use_native_text, use_heading_scan
+
+
+def analysis_settings_key(
+    dpi: int = 150,
+    use_native_text: bool | None = None,
+    use_heading_scan: bool | None = None,
+) -> str:
+    """
+    Everything that changes what lines a page produces. Defaults match a
+    PdfAnalysis built with defaults, so a key can be had without opening one.
+    """
+    use_native_text, use_heading_scan = _resolve_flags(use_native_text, use_heading_scan)
+    return (
+        f"dpi={dpi};native={use_native_text};heading={use_heading_scan};"
+        f"band={HEADING_BAND}:{HEADING_FULL_FALLBACK};heading_dpi={HEADING_DPI};min_native={MIN_NATIVE_CHARS}:{SCAN_IMAGE_COVERAGE}:{MIN_NATIVE_CHARS_OVER_SCAN};"
+        f"backend={backend_name()};"
+        f"adaptive={OCR_ADAPTIVE}:{ADAPTIVE_DPI_STEPS}:{MIN_OCR_CONFIDENCE}"
+    )
+
+
+class PdfAnalysis:
+    """
+    Opens a signed PDF once and OCRs each page at most once, so the
+    line-item extractor and the inspection detector share the same lines.
+
+    Section detection reads heading_lines(), which only OCRs a cropped top
+    band; full-page lines() are meant for pages inside a section. Heading
+    OCR is scheduled a window of pages ahead of the caller, full-page OCR
+    only up to the stop a caller passes, so nothing past a section is
+    full-OCR'd just because it came next.
+    """
+
+    def __init__(
+        self,
+        pdf_path: str,
+        dpi: int = 150,
+        use_native_text: bool | None = None,
+        use_heading_scan: bool | None = None,
+        update_index: bool = True,
+    ):
+        use_native_text, use_heading_scan = _resolve_flags(use_native_text, use_heading_scan)
+
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.use_native_text = use_native_text
+        self.use_heading_scan = use_heading_scan
+        # Workers reopen the file; this tells them which version it was
+        self._file_id = file_identity(pdf_path)
+        self.doc = fitz.open(pdf_path)
+        self._native: dict[int, PageText | None] = {}
+        self._cache: dict[str, dict[int, PageText]] = {"full": {}, "heading": {}}
+        self._pending = {}
+        self._pool = get_pool()
+        # Schedule one page per worker ahead of the caller
+        self._window = pool_size() if self._pool is not None else 1
+        self._ocr_seconds: dict[str, list[float]] = {"full": [], "heading": []}
+        self._dpi_used: dict[str, dict[int, int]] = {"full": {}, "heading": {}}
+        # Known boilerplate pages are answered from the fingerprint index
+        self._index = get_page_index()
+        self._fingerprints: dict[int, str] = {}
+        self._update_index = update_index
+        self.pages_native = 0
+        self.pages_reused = 0
+        self.pages_index_hits = 0
+
+    def __len__(self) -> int:
+        return len(self.doc)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def page_text(self, index: int, stop: int | None = None) -> PageText:
+        return self._fetch("full", index, index + 1 if stop is None else stop)
+
+    def heading_text(self, index: int) -> PageText:
+        if not self.use_heading_scan:
+            return self._fetch("full", index, index + 1)
+        return self._fetch("heading", index, len(self.doc))
+
+    def _fetch(self, mode: str, index: int, stop: int) -> PageText:
+        cache = self._cache[mode]
+        cached = cache.get(index)
+        if cached is not None:
+            self.pages_reused += 1
+            return cached
+
+        for i in range(index, min(len(self.doc), index + self._window, max(stop, index + 1))):
+            if i not in cache and (mode, i) not in self._pending:
+                self._load(mode, i)
+
+        # Futures are keyed by page index, so results come back in page order
+        # no matter which worker finishes first.
+        pending = self._pending.pop((mode, index), None)
+        if pending is not None:
+            try:
+                lines, elapsed, decisions = pending.result()
+            except BrokenProcessPool:
+                lines, elapsed, decisions = self._retry_on_new_pool(mode, index)
+            self._store(mode, index, lines, elapsed, decisions)
+        return cache[index]
+
+    def _retry_on_new_pool(self, mode: str, index: int):
+        # A worker died. Everything else queued on that pool is lost too, so
+        # drop it; those pages are submitted again when they are asked for.
+        # This page gets one more try on a fresh pool, never inline, in case
+        # it is what crashed the worker.
+        print(f"OCR worker died on or near page {index + 1}; retrying on a new pool")
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._pool = get_pool()
+        return self._pool.submit(ocr_page_worker, self._file_id, index, mode, self.dpi).result()
+
+    def _load(self, mode: str, index: int):
+        # A page whose full text is already known needs no heading OCR
+        if mode == "heading" and index in self._cache["full"]:
+            self._cache["heading"][index] = self._cache["full"][index]
+            return
+
+        native = self._native_text(index)
+        if native is not None:
+            self._cache[mode][index] = native
+            return
+
+        if self._index is not None:
+            if index not in self._fingerprints:
+                self._fingerprints[index] = page_fingerprint(self.doc, self.doc[index])
+            fingerprint = self._fingerprints[index]
+            known = self._index.lookup(fingerprint, mode, self.settings_key()) if fingerprint else None
+            if known is not None:
+                self._cache[mode][index] = PageText(known, "index")
+                self.pages_index_hits += 1
+                return
+
+        # Scanned or image-only page: rasterize and OCR
+        if self._pool is not None:
+            self._pending[(mode, index)] = self._pool.submit(
+                ocr_page_worker, self._file_id, index, mode, self.dpi
+            )
+        else:
+            lines, elapsed, decisions = _timed_ocr(self.doc[index], mode, self.dpi)
+            self._store(mode, index, lines, elapsed, decisions)
+
+    def _store(self, mode: str, index: int, lines: list[str], elapsed: float, decisions: list):
+        self._ocr_seconds[mode].append(elapsed)
+        self._dpi_used[mode][index] = decisions[-1][0]
+        if OCR_ADAPTIVE:
+            tried = " -> ".join(f"{dpi} DPI (conf {conf})" for dpi, conf in decisions)
+            print(f"Page {index + 1} {mode} OCR: {tried}")
+        self._cache[mode][index] = PageText(lines, "ocr" if mode == "full" else "heading")
+
+        fingerprint = self._fingerprints.get(index)
+        if self._index is not None and fingerprint is not None and self._update_index:
+            self._index.store(fingerprint, mode, self.settings_key(), lines)
+
+    def _native_text(self, index: int) -> PageText | None:
+        if not self.use_native_text:
+            return None
+        if index not in self._native:
+            page = self.doc[index]
+            lines = native_lines(page)
+            if _native_usable(page, lines, SECTION_HEADINGS):
+                self._native[index] = PageText(lines, "native")
+                self.pages_native += 1
+            else:
+                self._native[index] = None
+        return self._native[index]
+
+    def lines(self, index: int, stop: int | None = None) -> list[str]:
+        return self.page_text(index, stop).lines
+
+    def heading_lines(self, index: int) -> list[str]:
+        return self.heading_text(index).lines
+
+    def iter_pages(self, start: int = 0, stop: int | None = None):
+        """
+        Lazily yields (index, lines). Without a stop a page is only read or
+        OCR'd once the caller asks for it, so breaking out of the loop stops
+        the work; with one, every page up to stop is wanted and OCR runs
+        ahead within that range.
+        """
+        bounded = stop is not None
+        stop = len(self.doc) if stop is None else min(stop, len(self.doc))
+        for i in range(start, stop):
+            yield i, self.lines(i, stop if bounded else None)
+
+    def iter_headings(self, start: int = 0, stop: int | None = None):
+        """Like iter_pages, but yields the cheap heading-band lines."""
+        stop = len(self.doc) if stop is None else min(stop, len(self.doc))
+        for i in range(start, stop):
+            yield i, self.heading_lines(i)
+
+    def heading_passes(self):
+        """
+        Yields the page iterators section detection tries in turn: the
+        heading band first, then, with HEADING_FULL_FALLBACK, full pages if
+        the caller is still looking (it stops iterating once it finds its
+        section).
+        """
+        yield self.iter_headings()
+        if self.use_heading_scan and HEADING_FULL_FALLBACK:
+            print(f"No section heading in the top {HEADING_BAND:.0%} of any page; scanning full pages.")
+            yield self.iter_pages()
+
+    def settings_key(self) -> str:
+        return analysis_settings_key(self.dpi, self.use_native_text, self.use_heading_scan)
+
+    def export_pages(self) -> dict:
+        """Cached page text in a JSON-friendly form, for preload_pages()."""
+        return {
+            mode: {str(i): [p.lines, p.source] for i, p in cache.items()}
+            for mode, cache in self._cache.items()
+        }
+
+    def preload_pages(self, exported: dict):
+        for mode, pages in exported.items():
+            cache = self._cache.get(mode)
+            if cache is None:
+                continue
+            for i, (lines, source) in pages.items():
+                cache.setdefault(int(i), PageText(lines, source))
+
+    def sources(self) -> dict[int, str]:
+        return {i: p.source for i, p in sorted(self._cache["full"].items())}
+
+    def stats(self) -> dict:
+        full = self._ocr_seconds["full"]
+        heading = self._ocr_seconds["heading"]
+        return {
+            "pages": len(self.doc),
+            "pages_native": self.pages_native,
+            "pages_ocrd": len(full),
+            "pages_heading_ocrd": len(heading),
+            "pages_reused": self.pages_reused,
+            "pages_index_hits": self.pages_index_hits,
+            "full_ms_per_page": round(1000 * sum(full) / len(full), 1) if full else None,
+            "heading_ms_per_page": round(1000 * sum(heading) / len(heading), 1) if heading else None,
+            "ocr_seconds": round(sum(full) + sum(heading), 4),
+            "ocr_dpi": {mode: dict(sorted(used.items())) for mode, used in self._dpi_used.items()},
+            "sources": self.sources(),
+        }
+
+    def close(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        if not self.doc.is_closed:
+            self.doc.close()
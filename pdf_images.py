@@ -1,9 +1,15 @@
 # pdf_images.py
+import base64
+import os
+import shutil
+import tempfile
+from pathlib import Path
 import fitz
-import pytesseract
 from PIL import Image
 from io import BytesIO
-import re
+
+from pdf_analysis import PdfAnalysis, has_heading
+from raster import pixmap_to_image, render_page
 
 START_HEADING = "INSPECTION"
 END_HEADINGS = [
@@ -13,62 +19,136 @@ END_HEADINGS = [
     "AUTHORIZATION PAGE",
 ]
 
-def _ocr_lines(page, dpi=150) -> list[str]:
-    pix = page.get_pixmap(dpi=dpi)
-    img = Image.open(BytesIO(pix.tobytes("png")))
-    text = pytesseract.image_to_string(img)
-    # normalize lines
-    lines = [re.sub(r"\s+", " ", l).strip() for l in text.splitlines()]
-    return [l for l in lines if l]
-
-def _has_heading(lines: list[str], heading: str) -> bool:
-    # Heading must appear as its own line (or extremely close)
-    h = heading.strip().upper()
-    for l in lines:
-        lu = l.upper().strip().strip(":")
-        if lu == h:
-            return True
-    return False
-
-def extract_inspection_images(pdf_path: str):
-    doc = fitz.open(pdf_path)
+# Size of one cell in the rendered inspection grid
+GRID_IMAGE_SIZE = (480, 360)
+
+# Embedded images smaller than this (logos, icons, signature marks) are not photos
+MIN_EMBEDDED_IMAGE_PX = int(os.getenv("MIN_EMBEDDED_IMAGE_PX", "200"))
+
+def default_image_mode() -> str:
+    # "embedded" pulls the photos out of the page, "raster" snapshots the page
+    return os.getenv("INSPECTION_IMAGE_MODE", "embedded").lower()
+
+def image_settings_key(image_mode: str) -> str:
+    # Everything that changes which thumbnails come out and how they look
+    return f"mode={image_mode};grid={GRID_IMAGE_SIZE[0]}x{GRID_IMAGE_SIZE[1]};min_px={MIN_EMBEDDED_IMAGE_PX}"
+
+class ThumbnailSpool:
+    """
+    Inspection thumbnails, already downscaled to the grid cell and JPEG
+    encoded, spooled to a temp directory as they are produced so only one
+    photo is decoded in memory at a time. Iterating yields dicts with
+    page, path, width and height.
+    """
+
+    def __init__(self):
+        self.dir = Path(tempfile.mkdtemp(prefix="inspection_"))
+        self._entries = []
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add_image(self, page: int, img: Image.Image):
+        img.thumbnail(GRID_IMAGE_SIZE)
+        path = self.dir / f"{len(self._entries):04d}.jpg"
+        img.save(path, format="JPEG")
+        self._entries.append({"page": page, "path": str(path), "width": img.width, "height": img.height})
+
+    def add_encoded(self, page: int, jpeg_bytes: bytes, width: int, height: int):
+        path = self.dir / f"{len(self._entries):04d}.jpg"
+        path.write_bytes(jpeg_bytes)
+        self._entries.append({"page": page, "path": str(path), "width": width, "height": height})
+
+    def export(self) -> list:
+        """The thumbnails in a JSON-friendly form, JPEGs base64-encoded."""
+        return [
+            {
+                "page": e["page"],
+                "jpeg": base64.b64encode(Path(e["path"]).read_bytes()).decode("ascii"),
+                "width": e["width"],
+                "height": e["height"],
+            }
+            for e in self._entries
+        ]
+
+    @classmethod
+    def from_export(cls, exported: list):
+        spool = cls()
+        try:
+            for e in exported:
+                spool.add_encoded(int(e["page"]), base64.b64decode(e["jpeg"]), int(e["width"]), int(e["height"]))
+        except Exception:
+            spool.close()
+            raise
+        return spool
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self._entries = []
+
+def extract_inspection_images(pdf_path: str, analysis: PdfAnalysis | None = None, image_mode: str | None = None) -> ThumbnailSpool:
+    if image_mode is None:
+        image_mode = default_image_mode()
+
+    owns_analysis = analysis is None
+    if owns_analysis:
+        analysis = PdfAnalysis(pdf_path)
+
+    spool = ThumbnailSpool()
+    try:
+        for page_number, img in iter_inspection_images(analysis, image_mode):
+            spool.add_image(page_number, img)
+    except Exception:
+        spool.close()
+        raise
+    finally:
+        if owns_analysis:
+            analysis.close()
+    return spool
+
+def iter_inspection_images(analysis: PdfAnalysis, image_mode: str):
+    """
+    Lazily yields (page_number, image) for each inspection photo, each image
+    already no larger than twice the grid cell.
+    """
+    doc = analysis.doc
 
     inspection_start = None
     inspection_end = None
 
     # PASS 1: find inspection section strictly by standalone heading line
-    ocr_cache = []
-
-    for i in range(len(doc)):
-        lines = _ocr_lines(doc[i], dpi=150)
-        ocr_cache.append(lines)
-
-        if inspection_start is None and _has_heading(lines, START_HEADING):
-            inspection_start = i
-            continue
-
-        if inspection_start is not None and i > inspection_start:
-            # end when a section heading appears as standalone heading
-            for end_h in END_HEADINGS:
-                if _has_heading(lines, end_h):
-                    inspection_end = i
-                    break
-
-        if inspection_start is not None and inspection_end is not None:
+    # (only the cheap heading band is OCR'd here, unless no page has it)
+    for heading_pages in analysis.heading_passes():
+        for i, lines in heading_pages:
+            if inspection_start is None and has_heading(lines, START_HEADING):
+                inspection_start = i
+                continue
+
+            if inspection_start is not None and i > inspection_start:
+                # end when a section heading appears as standalone heading
+                for end_h in END_HEADINGS:
+                    if has_heading(lines, end_h):
+                        inspection_end = i
+                        break
+
+            if inspection_start is not None and inspection_end is not None:
+                break
+        if inspection_start is not None:
             break
 
     if inspection_start is None:
         # No inspection heading at all
-        return []
+        return
 
     if inspection_end is None:
         inspection_end = len(doc)
 
     # PASS 2: snapshot pages, BUT also guard against false positives:
     # inspection pages usually have very little OCR text (mostly images).
-    images = []
-    for page_index in range(inspection_start, inspection_end):
-        lines = ocr_cache[page_index] if page_index < len(ocr_cache) else _ocr_lines(doc[page_index])
+    for page_index, lines in analysis.iter_pages(inspection_start, inspection_end):
         word_count = sum(len(l.split()) for l in lines)
 
         # If this page has tons of text, it's probably NOT an inspection photo page
@@ -77,25 +157,63 @@ def extract_inspection_images(pdf_path: str):
             continue
 
         page = doc[page_index]
-        pix = page.get_pixmap(dpi=250)
-        img = Image.open(BytesIO(pix.tobytes("jpeg"))).convert("RGB")
 
-        images.append({"page": page_index + 1, "image": img})
+        found_photo = False
+        if image_mode == "embedded":
+            for img in _embedded_photos(doc, page):
+                found_photo = True
+                yield page_index + 1, img
+        if found_photo:
+            continue
+
+        # No usable embedded photos: snapshot the whole page, rendered just
+        # large enough for a sharp grid cell
+        pix = render_page(page, _snapshot_dpi(page))
+        yield page_index + 1, pixmap_to_image(pix)
+
+def _snapshot_dpi(page) -> int:
+    # Render at twice the final thumbnail scale, never above the old 250 DPI
+    scale = min(GRID_IMAGE_SIZE[0] / page.rect.width, GRID_IMAGE_SIZE[1] / page.rect.height)
+    return max(1, min(250, round(2 * 72 * scale)))
+
+def _embedded_photos(doc, page):
+    # get_images() lists everything in /Resources, which pages can share;
+    # get_image_info() only has what this page actually draws
+    seen = set()
+    for info in page.get_image_info(xrefs=True):
+        xref, width, height = info["xref"], info["width"], info["height"]
+        # xref 0 is an inline image, which has nothing to extract
+        if not xref or xref in seen or min(width, height) < MIN_EMBEDDED_IMAGE_PX:
+            continue
+        seen.add(xref)
+
+        try:
+            extracted = doc.extract_image(xref)
+            img = Image.open(BytesIO(extracted["image"]))
+            # JPEG photos decode straight at reduced scale; others are no-ops
+            img.draft("RGB", GRID_IMAGE_SIZE)
+            img = img.convert("RGB")
+        except Exception as exc:  # noqa: BLE001 odd encodings fall back to rasterizing
+            print(f"Warning: could not extract image xref {xref}: {exc}")
+            continue
 
-    return images
+        img.thumbnail(GRID_IMAGE_SIZE)
+        yield img
 
 def merge_cover_with_summary(original_pdf_path: str, summary_pdf_bytes: bytes) -> bytes:
+    # The signed PDF is opened from its file, so only page 0 is ever loaded
     original = fitz.open(original_pdf_path)
     summary = fitz.open(stream=summary_pdf_bytes, filetype="pdf")
-
     output = fitz.open()
-    output.insert_pdf(original, from_page=0, to_page=0)
-    output.insert_pdf(summary)
-
-    buf = BytesIO()
-    output.save(buf)
-    buf.seek(0)
-    return buf.getvalue()
+    try:
+        output.insert_pdf(original, from_page=0, to_page=0)
+        output.insert_pdf(summary)
+        # tobytes() hands back the serialized PDF without a BytesIO copy
+        return output.tobytes()
+    finally:
+        output.close()
+        summary.close()
+        original.close()
 
 def resize_for_grid(image: Image.Image, max_width=160, max_height=120):
     img = image.copy()
@@ -1,10 +1,8 @@
 # pdf_line_items.py
-import fitz
-import pytesseract
-from PIL import Image
-from io import BytesIO
 import re
 
+from pdf_analysis import PdfAnalysis, has_heading
+
 START_HEADING = "PREFERRED PACKAGE"
 END_HEADINGS = [
     "AUTHORIZATION PAGE",
@@ -29,21 +27,6 @@ NOISE_LINES = {
     "OPTIONAL ITEMS",
 }
 
-def _ocr_lines(page, dpi=150) -> list[str]:
-    pix = page.get_pixmap(dpi=dpi)
-    img = Image.open(BytesIO(pix.tobytes("png")))
-    text = pytesseract.image_to_string(img)
-    lines = [re.sub(r"\s+", " ", l).strip() for l in text.splitlines()]
-    return [l for l in lines if l]
-
-def _has_heading(lines: list[str], heading: str) -> bool:
-    h = heading.strip().upper()
-    for l in lines:
-        lu = l.upper().strip().strip(":")
-        if lu == h:
-            return True
-    return False
-
 def _find_total(text_upper: str) -> float | None:
     for pat in TOTAL_PATTERNS:
         m = re.search(pat, text_upper)
@@ -51,62 +34,71 @@ def _find_total(text_upper: str) -> float | None:
             return float(m.group(1).replace(",", ""))
     return None
 
-def extract_preferred_package_items(pdf_path: str):
+def extract_preferred_package_items(pdf_path: str, analysis: PdfAnalysis | None = None):
     """
     Returns: (items, extracted_total)
     items are compatible with process_line_items()
     """
-    doc = fitz.open(pdf_path)
+    owns_analysis = analysis is None
+    if owns_analysis:
+        analysis = PdfAnalysis(pdf_path)
 
-    # OCR pass but only keep pages that matter
-    page_lines = []
-    page_text_upper = []
+    try:
+        return _extract_preferred_package_items(analysis)
+    finally:
+        if owns_analysis:
+            analysis.close()
 
-    for i in range(len(doc)):
-        lines = _ocr_lines(doc[i], dpi=150)
-        page_lines.append(lines)
-        page_text_upper.append("\n".join(lines).upper())
+def _extract_preferred_package_items(analysis: PdfAnalysis):
+    page_count = len(analysis)
 
-    # Find preferred package start page
     start_page = None
-    for i, lines in enumerate(page_lines):
-        if _has_heading(lines, START_HEADING):
-            start_page = i
-            break
-
-    if start_page is None:
-        print(" Preferred Package heading not found.")
-        return [], None
-
-    # Find end page
     end_page = None
-    for i in range(start_page + 1, len(doc)):
-        lines = page_lines[i]
-        for h in END_HEADINGS:
-            if _has_heading(lines, h):
-                end_page = i
+    total_window_end = None
+    section_lines = []
+    extracted_total = None
+
+    # Single lazy pass: headings come from the cheap band OCR, full pages are
+    # only OCR'd inside the section (and its total window), and the scan
+    # stops as soon as the section end and the total are both known. Only
+    # when no page has the heading in its band are full pages searched.
+    for heading_pages in analysis.heading_passes():
+        for i, heading_lines in heading_pages:
+            if start_page is None:
+                if not has_heading(heading_lines, START_HEADING):
+                    continue
+                start_page = i
+                total_window_end = min(page_count, start_page + 8)
+
+            if end_page is None and i > start_page:
+                if any(has_heading(heading_lines, h) for h in END_HEADINGS):
+                    end_page = i
+
+            if end_page is not None and (extracted_total is not None or i >= total_window_end):
                 break
-        if end_page is not None:
-            break
 
-    if end_page is None:
-        end_page = len(doc)
+            lines = analysis.lines(i)
 
-    # Flatten relevant section lines
-    section_lines = []
-    for i in range(start_page, end_page):
-        section_lines.extend(page_lines[i])
+            if end_page is None:
+                section_lines.extend(lines)
 
-    # Extract total from relevant pages as well (and/or later pages if needed)
-    extracted_total = None
-    for i in range(start_page, min(len(doc), start_page + 8)):
-        extracted_total = _find_total(page_text_upper[i])
-        if extracted_total is not None:
+            if extracted_total is None and i < total_window_end:
+                extracted_total = _find_total("\n".join(lines).upper())
+
+            if end_page is not None and (extracted_total is not None or i + 1 >= total_window_end):
+                break
+        if start_page is not None:
             break
+
+    if start_page is None:
+        print(" Preferred Package heading not found.")
+        return [], None
+
     if extracted_total is None:
-        # fallback: scan whole doc quickly
-        for t in page_text_upper:
-            extracted_total = _find_total(t)
+        # fallback: scan the doc from the top; pages already read come from
+        # the cache and the rest are only OCR'd until a total turns up
+        for i, lines in analysis.iter_pages():
+            extracted_total = _find_total("\n".join(lines).upper())
             if extracted_total is not None:
                 break
 
@@ -1,13 +1,24 @@
 ﻿import os
 import tempfile
+import time
 from pathlib import Path
 
 import requests
 
+from jobs import Job
+from metrics import metrics
 from processing import process_line_items
-from render_pdf import render_pdf
-from pdf_images import extract_inspection_images, merge_cover_with_summary
+from render_pdf import render_summaries
+from pdf_images import (
+    ThumbnailSpool,
+    default_image_mode,
+    extract_inspection_images,
+    image_settings_key,
+    merge_cover_with_summary,
+)
 from pdf_line_items import extract_preferred_package_items
+from pdf_analysis import PdfAnalysis, analysis_settings_key
+from result_cache import cache_key, file_digest, get_result_cache
 
 try:
     from odoo_client import upload_pdfs_to_odoo
@@ -19,20 +30,59 @@ DEFAULT_OUTPUT_QTY = Path("output/roof_scope_quantity.pdf")
 DEFAULT_OUTPUT_PRICE = Path("output/roof_scope_price.pdf")
 DEFAULT_SIGNED_PDF = Path("data/signed1.pdf")
 
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", str(100 * 1024 * 1024)))
+PDF_CHUNK_SIZE = 256 * 1024
 
-def _download_signed_pdf(download_url: str) -> str:
-    resp = requests.get(download_url, timeout=30)
-    resp.raise_for_status()
-    content_type = resp.headers.get("content-type", "").lower()
-    if "pdf" not in content_type and not resp.content.startswith(b"%PDF"):
-        raise ValueError(f"Download did not return a PDF (content-type: {content_type or 'unknown'})")
-    fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
-    with os.fdopen(fd, "wb") as f:
-        f.write(resp.content)
+
+class PdfTooLarge(ValueError):
+    pass
+
+
+def spool_pdf(chunks, suffix: str = ".pdf", check_magic: bool = True) -> str:
+    """
+    Writes byte chunks to a temp file as they arrive, so the PDF is never
+    held in memory whole. The %PDF magic is checked on the first chunk and
+    MAX_PDF_BYTES is enforced while streaming.
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if written == 0 and check_magic and not chunk.startswith(b"%PDF"):
+                    raise ValueError("File is not a PDF")
+                written += len(chunk)
+                if written > MAX_PDF_BYTES:
+                    raise PdfTooLarge(f"PDF exceeds the {MAX_PDF_BYTES} byte limit")
+                f.write(chunk)
+    except Exception:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
     return tmp_path
 
 
-def _resolve_signed_pdf_path(payload: dict, signed_pdf_path: str | None):
+def download_signed_pdf(download_url: str) -> str:
+    with requests.get(download_url, timeout=30, stream=True) as resp:
+        resp.raise_for_status()
+        content_type = resp.headers.get("content-type", "").lower()
+
+        content_length = resp.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_PDF_BYTES:
+            raise PdfTooLarge(f"Download is {content_length} bytes, over the {MAX_PDF_BYTES} byte limit")
+
+        try:
+            # A server that says PDF is trusted, as before; otherwise the
+            # first chunk has to carry the magic
+            return spool_pdf(resp.iter_content(PDF_CHUNK_SIZE), check_magic="pdf" not in content_type)
+        except PdfTooLarge:
+            raise
+        except ValueError:
+            raise ValueError(f"Download did not return a PDF (content-type: {content_type or 'unknown'})") from None
+
+
+def _resolve_signed_pdf_path(job: Job, payload: dict, signed_pdf_path: str | None):
     cleanup_paths: list[str] = []
 
     if signed_pdf_path:
@@ -50,74 +100,268 @@ def _resolve_signed_pdf_path(payload: dict, signed_pdf_path: str | None):
 
     download_url = payload.get("signed_pdf", {}).get("download_url") if isinstance(payload, dict) else None
     if download_url:
-        tmp_path = _download_signed_pdf(download_url)
+        # Same stage name as a batch item's download
+        with job.stage("download"):
+            tmp_path = download_signed_pdf(download_url)
         cleanup_paths.append(tmp_path)
         return tmp_path, cleanup_paths
 
     return None, cleanup_paths
 
 
-def run_pipeline(payload: dict, signed_pdf_path: str | None = None):
-    signed_pdf_path, cleanup_paths = _resolve_signed_pdf_path(payload, signed_pdf_path)
+def contract_scope(payload: dict) -> str | None:
+    """
+    Stable identity of the contract a payload is for, used to match the
+    Odoo attachments a previous run of the same contract uploaded. None
+    when the payload carries nothing to tell contracts apart.
+    """
+    project = payload.get("project") or {}
+    if project.get("id"):
+        return f"id:{project['id']}"
+    identity = {k: project.get(k) for k in ("customer_name", "address", "city", "state", "postal_code")}
+    if not any(identity.values()):
+        return None
+    return cache_key(identity)
 
-    project = payload["project"]
-    raw_items = payload.get("line_items", [])
 
-    extracted_total = None
+def run_pipeline(
+    payload: dict,
+    signed_pdf_path: str | None = None,
+    job: Job | None = None,
+    use_cache: bool = True,
+    write_outputs: bool = True,
+    upload: bool = True,
+    on_pdf=None,
+) -> dict:
+    """
+    Runs one contract end to end. Outputs go to the job's workspace; without
+    a job they land in output/ as before. use_cache=False skips the result
+    cache for both reads and writes. write_outputs=False keeps the run off
+    disk: no PDFs in the workspace and no result-cache or page-index writes,
+    though cache hits are still used. upload=False skips Odoo. on_pdf(kind, pdf_bytes) is called
+    with "quantity" and then "price" as soon as each final PDF exists.
+    """
+    if job is None:
+        job = Job(id="local", workspace=DEFAULT_OUTPUT_QTY.parent)
 
-    if (not raw_items) and signed_pdf_path:
-        print("No line items in payload, extracting from PDF...")
-        raw_items, extracted_total = extract_preferred_package_items(signed_pdf_path)
+    started = time.perf_counter()
+    state = "failed"
+    cleanup_paths = []
+    try:
+        signed_pdf_path, cleanup_paths = _resolve_signed_pdf_path(job, payload, signed_pdf_path)
+        if cleanup_paths:
+            job.count("bytes_downloaded", os.path.getsize(signed_pdf_path))
 
-    # store total if we found it
-    if extracted_total is not None:
-        project["extracted_total"] = extracted_total
+        result = _run_pipeline(job, payload, signed_pdf_path, use_cache, write_outputs, upload, on_pdf)
+        state = "succeeded"
+        return result
+    finally:
+        for p in cleanup_paths:
+            try:
+                Path(p).unlink(missing_ok=True)
+            except Exception as exc:  # noqa: BLE001 cleanup best-effort
+                print(f"Warning: failed to delete temp file {p}: {exc}")
+        metrics.record_job(job, time.perf_counter() - started, state)
 
-    processed_items = process_line_items(raw_items)
 
-    inspection_images = []
-    if signed_pdf_path:
-        inspection_images = extract_inspection_images(signed_pdf_path)
+def _run_pipeline(
+    job: Job,
+    payload: dict,
+    signed_pdf_path: str | None,
+    use_cache: bool,
+    write_outputs: bool = True,
+    upload: bool = True,
+    on_pdf=None,
+) -> dict:
+    result = {}
 
-    qty_pdf = render_pdf(project, processed_items, inspection_images, show_prices=False)
-    price_pdf = render_pdf(project, processed_items, inspection_images, show_prices=True)
+    cache = get_result_cache() if use_cache else None
+    if cache is not None and not write_outputs:
+        cache = cache.read_only()
+    final_qty_pdf, final_price_pdf = _build_pdfs(
+        job, payload, signed_pdf_path, cache, result, on_pdf, persist=write_outputs
+    )
+    if cache is not None:
+        result["cache"] = cache.stats()
 
-    Path("output").mkdir(exist_ok=True)
+    if write_outputs:
+        job.workspace.mkdir(parents=True, exist_ok=True)
+        qty_path = job.workspace / DEFAULT_OUTPUT_QTY.name
+        price_path = job.workspace / DEFAULT_OUTPUT_PRICE.name
 
-    if signed_pdf_path:
-        final_qty_pdf = merge_cover_with_summary(signed_pdf_path, qty_pdf)
-        final_price_pdf = merge_cover_with_summary(signed_pdf_path, price_pdf)
+        qty_path.write_bytes(final_qty_pdf)
+        price_path.write_bytes(final_price_pdf)
+        job.outputs = {"quantity": str(qty_path), "price": str(price_path)}
+        qty_source, price_source = str(qty_path), str(price_path)
     else:
-        final_qty_pdf = qty_pdf
-        final_price_pdf = price_pdf
-
-    qty_path = DEFAULT_OUTPUT_QTY
-    price_path = DEFAULT_OUTPUT_PRICE
-
-    qty_path.write_bytes(final_qty_pdf)
-    price_path.write_bytes(final_price_pdf)
+        qty_source, price_source = final_qty_pdf, final_price_pdf
 
     print("PDF generation complete.")
 
+    if not upload:
+        print("Odoo upload skipped for this run.")
+        return result
+
     if upload_pdfs_to_odoo is None:
         print("Odoo client not available; skipping upload.")
-        return
+        return result
 
     if os.getenv("ODOO_UPLOAD_ENABLED", "true").lower() == "false":
         print("Odoo upload disabled by ODOO_UPLOAD_ENABLED.")
-        return
+        return result
 
     try:
-        results = upload_pdfs_to_odoo(str(qty_path), str(price_path))
+        with job.stage("upload"):
+            results = upload_pdfs_to_odoo(qty_source, price_source, scope=contract_scope(payload))
+        result["odoo"] = results
+        job.count("upload_retries", results.get("retries", 0))
+        job.count("bytes_uploaded", results.get("uploaded_bytes", 0))
+        job.count("bytes_upload_skipped", results.get("skipped_bytes", 0))
         print(f"Odoo upload results: {results}")
     except ValueError as cfg_err:
         # Missing env vars, so skip silently but log
         print(f"Odoo upload skipped (config missing): {cfg_err}")
     except Exception as exc:  # noqa: BLE001 keep broad so pipeline still completes
         print(f"Odoo upload failed: {exc}")
+        result["odoo_error"] = str(exc)
+
+    return result
+
+
+def _build_pdfs(
+    job: Job,
+    payload: dict,
+    signed_pdf_path: str | None,
+    cache,
+    result: dict,
+    on_pdf=None,
+    persist: bool = True,
+) -> tuple[bytes, bytes]:
+    emit = on_pdf or (lambda kind, pdf: None)
+
+    # Cache entries are addressed by the signed PDF's bytes; without a PDF
+    # there is no OCR to save, so nothing is cached.
+    pdf_digest = None
+    if cache is not None and cache.enabled and signed_pdf_path:
+        with job.stage("hash_pdf"):
+            pdf_digest = file_digest(signed_pdf_path)
+
+    # Keyed on the payload as received, before extracted_total is added, and
+    # on every setting that changes the extracted text or the thumbnails
+    image_mode = default_image_mode()
+    pdfs_key = None
+    if pdf_digest:
+        pdfs_key = cache_key(
+            pdf_digest,
+            payload.get("project"),
+            payload.get("line_items", []),
+            analysis_settings_key(),
+            image_settings_key(image_mode),
+        )
+        qty_cached = cache.get("pdfs", f"{pdfs_key}-quantity")
+        price_cached = cache.get("pdfs", f"{pdfs_key}-price")
+        if qty_cached is not None and price_cached is not None:
+            print("Result cache hit: reusing generated PDFs.")
+            result["cache_hit"] = "pdfs"
+            emit("quantity", qty_cached)
+            emit("price", price_cached)
+            return qty_cached, price_cached
+
+    project = payload["project"]
+    raw_items = payload.get("line_items", [])
+
+    extracted_total = None
+
+    # One analysis per job so each page is OCR'd at most once
+    analysis = PdfAnalysis(signed_pdf_path, update_index=persist) if signed_pdf_path else None
+
+    try:
+        ocr_key = None
+        if analysis is not None and pdf_digest:
+            ocr_key = cache_key(pdf_digest, analysis.settings_key())
+            cached_pages = cache.get_json("ocr", ocr_key)
+            if cached_pages:
+                analysis.preload_pages(cached_pages)
+
+        if (not raw_items) and analysis is not None:
+            items_key = cache_key(pdf_digest, "items", analysis.settings_key()) if pdf_digest else None
+            cached_items = cache.get_json("items", items_key) if items_key else None
+            if cached_items is not None:
+                raw_items, extracted_total = cached_items["items"], cached_items["total"]
+            else:
+                print("No line items in payload, extracting from PDF...")
+                with job.stage("extract_items"):
+                    raw_items, extracted_total = extract_preferred_package_items(signed_pdf_path, analysis=analysis)
+                if items_key:
+                    cache.put_json("items", items_key, {"items": raw_items, "total": extracted_total})
+
+        # store total if we found it
+        if extracted_total is not None:
+            project["extracted_total"] = extracted_total
+
+        processed_items = process_line_items(raw_items)
+
+        # The spool is a temp dir; everything from its creation on is covered
+        inspection_images = None
+        try:
+            if analysis is not None:
+                images_key = (
+                    cache_key(pdf_digest, "thumbnails-json", analysis.settings_key(), image_settings_key(image_mode))
+                    if pdf_digest else None
+                )
+                cached_images = cache.get_json("images", images_key) if images_key else None
+                if cached_images is not None:
+                    inspection_images = ThumbnailSpool.from_export(cached_images)
+                else:
+                    with job.stage("extract_images"):
+                        inspection_images = extract_inspection_images(signed_pdf_path, analysis=analysis, image_mode=image_mode)
+                    job.count("images_extracted", len(inspection_images))
+                    if images_key:
+                        cache.put_json("images", images_key, inspection_images.export())
+                result["inspection_images"] = len(inspection_images)
+
+                stats = analysis.stats()
+                result["page_text"] = stats
+                # Summed per-page OCR time, which exceeds wall time when pages
+                # run in parallel, so it is a counter and not a stage; the wall
+                # time is already in the extract stages
+                job.count("ocr_page_seconds", stats["ocr_seconds"])
+                for name in ("pages", "pages_native", "pages_ocrd", "pages_heading_ocrd", "pages_index_hits"):
+                    job.count(name, stats[name])
+                print(
+                    f"Page text: {stats['pages_native']} native, {stats['pages_ocrd']} OCR'd, "
+                    f"{stats['pages_heading_ocrd']} heading-only, {stats['pages_reused']} reused (of {stats['pages']})"
+                )
+                print(f"Page index: {stats['pages_index_hits']} known pages skipped OCR")
+                print(
+                    f"OCR latency per page: full {stats['full_ms_per_page']} ms, "
+                    f"heading band {stats['heading_ms_per_page']} ms"
+                )
+                # Only rewrite the OCR layer when this run read pages it didn't have
+                if ocr_key and (stats["pages_native"] or stats["pages_ocrd"] or stats["pages_heading_ocrd"]):
+                    cache.put_json("ocr", ocr_key, analysis.export_pages())
+                analysis.close()
+
+            with job.stage("render"):
+                qty_pdf, price_pdf = render_summaries(project, processed_items, inspection_images or [])
+        finally:
+            if inspection_images is not None:
+                inspection_images.close()
     finally:
-        for p in cleanup_paths:
-            try:
-                Path(p).unlink(missing_ok=True)
-            except Exception as exc:  # noqa: BLE001 cleanup best-effort
-                print(f"Warning: failed to delete temp file {p}: {exc}")
+        # Normally closed before rendering already; this covers errors
+        if analysis is not None:
+            analysis.close()
+
+    # Each PDF is handed out as soon as it is merged
+    with job.stage("merge"):
+        final_qty_pdf = merge_cover_with_summary(signed_pdf_path, qty_pdf) if signed_pdf_path else qty_pdf
+    emit("quantity", final_qty_pdf)
+    with job.stage("merge"):
+        final_price_pdf = merge_cover_with_summary(signed_pdf_path, price_pdf) if signed_pdf_path else price_pdf
+    emit("price", final_price_pdf)
+
+    if pdfs_key:
+        cache.put("pdfs", f"{pdfs_key}-quantity", final_qty_pdf)
+        cache.put("pdfs", f"{pdfs_key}-price", final_price_pdf)
+
+    return final_qty_pdf, final_price_pdf
@@ -0,0 +1,100 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from jobs import Job
+
+# Fraction of jobs profiled without being asked; 0 keeps profiling off
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Whether a request can ask for profiling itself (X-Profile: 1); off by
+# default so callers can't make the service profile on demand
+PROFILE_ALLOW_REQUESTS = os.getenv("PROFILE_ALLOW_REQUESTS", "false").lower() == "true"
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "30"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "5"))
+
+# cProfile can only be active in one thread at a time on newer Pythons, and
+# tracemalloc sees the whole process, so profiled jobs take turns
+_active = threading.Lock()
+
+
+def should_profile(requested: bool = False) -> bool:
+    if requested and PROFILE_ALLOW_REQUESTS:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+@contextmanager
+def profiled(job: Job):
+    """
+    Runs the block under cProfile and tracemalloc and writes profile.pstats,
+    profile.txt and allocations.txt into the job workspace; a job created
+    without one (store=0) only gets the peak memory counter. Only the calling
+    thread is profiled, not the OCR worker processes. If another job is
+    being profiled already the block just runs.
+    """
+    if not _active.acquire(blocking=False):
+        print(f"Profiling skipped for job {job.id}: another job is being profiled")
+        yield
+        return
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            _write_profile(job, profiler, snapshot, peak)
+    finally:
+        _active.release()
+
+
+def _write_profile(job: Job, profiler: cProfile.Profile, snapshot, peak_bytes: int):
+    job.counters["profile_peak_traced_bytes"] = peak_bytes
+    # A job that stores nothing gets no workspace, and the profile must not
+    # leave one behind outside the store's size accounting
+    if not job.workspace.is_dir():
+        print(f"Profile for job {job.id} not written: the job has no workspace")
+        return
+    try:
+        pstats_path = job.workspace / "profile.pstats"
+        profiler.dump_stats(pstats_path)
+
+        text = io.StringIO()
+        stats = pstats.Stats(profiler, stream=text)
+        stats.sort_stats("cumulative").print_stats(60)
+        report_path = job.workspace / "profile.txt"
+        report_path.write_text(text.getvalue())
+
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ])
+        lines = [f"Peak traced memory: {peak_bytes / 1024 ** 2:.1f} MiB", ""]
+        for i, stat in enumerate(snapshot.statistics("traceback")[:PROFILE_TOP_ALLOCATIONS], 1):
+            lines.append(f"#{i}: {stat.size / 1024:.1f} KiB in {stat.count} blocks")
+            lines.extend(f"    {line}" for line in stat.traceback.format())
+        allocations_path = job.workspace / "allocations.txt"
+        allocations_path.write_text("\n".join(lines) + "\n")
+    except Exception as exc:  # noqa: BLE001 profiling must never fail the job
+        print(f"Warning: could not write profile for job {job.id}: {exc}")
+        return
+
+    job.outputs.update({
+        "profile": str(pstats_path),
+        "profile_report": str(report_path),
+        "allocations": str(allocations_path),
+    })
+    print(f"Profile for job {job.id} written to {job.workspace}")
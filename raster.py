@@ -0,0 +1,34 @@
+# raster.py
+import fitz
+from PIL import Image
+
+# PIL mode for a pixmap's sample layout, keyed by (components, alpha)
+_PIL_MODES = {
+    (1, False): "L",
+    (3, False): "RGB",
+    (4, True): "RGBA",
+}
+
+
+def render_page(page, dpi: int, clip=None, gray: bool = False):
+    colorspace = fitz.csGRAY if gray else fitz.csRGB
+    return page.get_pixmap(dpi=dpi, clip=clip, colorspace=colorspace, alpha=False)
+
+
+def pixmap_to_image(pix) -> Image.Image:
+    """
+    Wraps a PyMuPDF pixmap's raw samples in a PIL image without going
+    through PNG/JPEG. The samples are copied once into a bytes object the
+    image owns, so it stays valid after the pixmap is gone; exporting the
+    pixmap's own memoryview instead breaks when PyMuPDF releases it.
+    """
+    mode = _PIL_MODES[(pix.n, bool(pix.alpha))]
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples, "raw", mode, pix.stride, 1)
+
+
+def as_tesseract_input(img: Image.Image) -> Image.Image:
+    # pytesseract writes the image to a temp file in img.format (PNG when
+    # unset); PPM/PGM is a plain header plus the raw samples, no compression.
+    # The format has no DPI field, so callers pass --dpi to tesseract.
+    img.format = "PPM"
+    return img
@@ -1,8 +1,11 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from io import BytesIO
 from reportlab.lib.pagesizes import LETTER
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
-from pdf_images import resize_for_grid
+from pdf_images import GRID_IMAGE_SIZE, resize_for_grid
 from reportlab.platypus import (
     SimpleDocTemplate,
     Table,
@@ -27,7 +30,108 @@ SECTION_TITLES = {
     "extra_work": "EXTRA WORK / MODIFICATIONS",
 }
 
+# Built once; the styles are only read while rendering
+_STYLES = getSampleStyleSheet()
+
+@dataclass
+class PreparedSummary:
+    """
+    Everything both summary variants share: header text, grouped rows with
+    their flag markup, and the inspection thumbnails already JPEG-encoded.
+    """
+    customer_name: str
+    full_address: str
+    sections: list = field(default_factory=list)  # [(category, [row, ...])]
+    extracted_total: float | None = None
+    thumbnails: list = field(default_factory=list)  # [(jpeg_bytes or path, width, height)]
+
+
+def prepare_summary(project: dict, items: list, inspection_images: list) -> PreparedSummary:
+    full_address = (
+        f"{project.get('address', '')}, "
+        f"{project.get('city', '')}, "
+        f"{project.get('state', '')} "
+        f"{project.get('postal_code', '')}"
+    ).strip().replace(" ,", ",")
+
+    # ─────────────────────────────────────
+    # Group items by category
+    # ─────────────────────────────────────
+    grouped = {
+        "warranty": [],
+        "standard": [],
+        "extra_work": []
+    }
+
+    for item in items:
+        desc = item["final_description"]
+
+        flags = []
+
+        if item.get("modified"):
+            flags.append("MODIFIED")
+
+        if item["quantity"] == 0:
+            flags.append("QTY = 0")
+
+        if flags:
+            desc += f" <font size=9><b>[{' | '.join(flags)}]</b></font>"
+
+        grouped[item["category"]].append({
+            "desc": desc,
+            "quantity": str(item["quantity"]),
+            "price": item.get("price"),
+            "background": COLOR_MAP[item["highlight_color"]],
+        })
+
+    # ─────────────────────────────────────
+    # Encode inspection thumbnails once
+    # ─────────────────────────────────────
+    thumbnails = []
+    for img_data in inspection_images:
+        if "path" in img_data:
+            # Already downscaled and encoded (ThumbnailSpool); reportlab
+            # reads the file lazily while drawing
+            thumbnails.append((img_data["path"], img_data["width"], img_data["height"]))
+            continue
+
+        img = resize_for_grid(img_data["image"], *GRID_IMAGE_SIZE)
+        buf = BytesIO()
+        img.save(buf, format="JPEG")
+        thumbnails.append((buf.getvalue(), img.width, img.height))
+
+    return PreparedSummary(
+        customer_name=project.get("customer_name"),
+        full_address=full_address,
+        sections=[(category, rows) for category, rows in grouped.items() if rows],
+        extracted_total=project.get("extracted_total"),
+        thumbnails=thumbnails,
+    )
+
+
 def render_pdf(project: dict, items: list, inspection_images: list, show_prices: bool) -> bytes:
+    return render_prepared(prepare_summary(project, items, inspection_images), show_prices)
+
+
+def render_summaries(project: dict, items: list, inspection_images: list, parallel: bool | None = None) -> tuple[bytes, bytes]:
+    """
+    Returns (quantity_pdf, price_pdf) built from one shared preparation pass.
+    """
+    if parallel is None:
+        parallel = os.getenv("RENDER_PARALLEL", "false").lower() == "true"
+
+    prepared = prepare_summary(project, items, inspection_images)
+
+    if not parallel:
+        return render_prepared(prepared, show_prices=False), render_prepared(prepared, show_prices=True)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        qty_future = executor.submit(render_prepared, prepared, False)
+        price_future = executor.submit(render_prepared, prepared, True)
+        return qty_future.result(), price_future.result()
+
+
+def render_prepared(prepared: PreparedSummary, show_prices: bool) -> bytes:
     buffer = BytesIO()
 
     doc = SimpleDocTemplate(
@@ -36,10 +140,12 @@ def render_pdf(project: dict, items: list, inspection_images: list, show_prices:
         rightMargin=36,
         leftMargin=36,
         topMargin=36,
-        bottomMargin=36
+        bottomMargin=36,
+        # No timestamps or random IDs, so identical input renders identical bytes
+        invariant=1,
     )
 
-    styles = getSampleStyleSheet()
+    styles = _STYLES
     elements = []
 
     # ─────────────────────────────────────
@@ -53,42 +159,20 @@ def render_pdf(project: dict, items: list, inspection_images: list, show_prices:
     elements.append(Paragraph(subtitle, styles["Italic"]))
     elements.append(Spacer(1, 10))
 
-    full_address = (
-        f"{project.get('address', '')}, "
-        f"{project.get('city', '')}, "
-        f"{project.get('state', '')} "
-        f"{project.get('postal_code', '')}"
-    ).strip().replace(" ,", ",")
-
     elements.append(Paragraph(
-        f"<b>Customer:</b> {project.get('customer_name')}<br/>"
-        f"<b>Address:</b> {full_address}",
+        f"<b>Customer:</b> {prepared.customer_name}<br/>"
+        f"<b>Address:</b> {prepared.full_address}",
         styles["Normal"]
     ))
 
     elements.append(Spacer(1, 16))
 
-    # ─────────────────────────────────────
-    # Group items by category
-    # ─────────────────────────────────────
-    grouped = {
-        "warranty": [],
-        "standard": [],
-        "extra_work": []
-    }
-
-    for item in items:
-        grouped[item["category"]].append(item)
-
     grand_total = 0.0
 
     # ─────────────────────────────────────
     # Render each section
     # ─────────────────────────────────────
-    for category, section_items in grouped.items():
-        if not section_items:
-            continue
-
+    for category, section_rows in prepared.sections:
         elements.append(Spacer(1, 12))
         elements.append(Paragraph(
             f"<b>{SECTION_TITLES[category]}</b>",
@@ -103,32 +187,18 @@ def render_pdf(project: dict, items: list, inspection_images: list, show_prices:
         table_data = [header]
         row_colors = []
 
-        for item in section_items:
-            desc = item["final_description"]
-
-            flags = []
-
-            if item.get("modified"):
-                flags.append("MODIFIED")
-
-            if item["quantity"] == 0:
-                flags.append("QTY = 0")
-
-            if flags:
-                desc += f" <font size=9><b>[{' | '.join(flags)}]</b></font>"
-
-
+        for section_row in section_rows:
             row = [
-                Paragraph(desc, styles["Normal"]),
-                str(item["quantity"])
+                Paragraph(section_row["desc"], styles["Normal"]),
+                section_row["quantity"]
             ]
 
             if show_prices:
-                row.append(f"${item['price']:.2f}")
-                grand_total += item["price"]
+                row.append(f"${section_row['price']:.2f}")
+                grand_total += section_row["price"]
 
             table_data.append(row)
-            row_colors.append(COLOR_MAP[item["highlight_color"]])
+            row_colors.append(section_row["background"])
 
         col_widths = [360, 60, 80] if show_prices else [420, 60]
 
@@ -155,7 +225,7 @@ def render_pdf(project: dict, items: list, inspection_images: list, show_prices:
     # ─────────────────────────────────────
     if show_prices:
         total = grand_total
-        extracted_total = project.get("extracted_total")
+        extracted_total = prepared.extracted_total
 
         # If prices are not present per-item, use extracted_total
         if (total == 0.0) and (extracted_total is not None):
@@ -174,7 +244,7 @@ def render_pdf(project: dict, items: list, inspection_images: list, show_prices:
     elements.append(Paragraph("<b>INSPECTION SUMMARY</b>", styles["Heading3"]))
     elements.append(Spacer(1, 6))
 
-    if inspection_images:
+    if prepared.thumbnails:
         inspection_text = (
             "Inspection photos were detected in the signed contract and have been "
             "condensed into the attached inspection snapshot section."
@@ -190,7 +260,7 @@ def render_pdf(project: dict, items: list, inspection_images: list, show_prices:
     # ─────────────────────────────────────
     # Inspection Images Page
     # ─────────────────────────────────────
-    if inspection_images:
+    if prepared.thumbnails:
         elements.append(PageBreak())
         elements.append(Paragraph("<b>INSPECTION REFERENCE SNAPSHOTS</b>", styles["Title"]))
         elements.append(Spacer(1, 8))
@@ -199,13 +269,10 @@ def render_pdf(project: dict, items: list, inspection_images: list, show_prices:
         grid = []
         cols = 2
 
-        for img_data in inspection_images:
-            img = resize_for_grid(img_data["image"], 480, 360)
-            buf = BytesIO()
-            img.save(buf, format="JPEG")
-            buf.seek(0)
-
-            rl_img = RLImage(buf, width=img.width, height=img.height)
+        for source, width, height in prepared.thumbnails:
+            if isinstance(source, bytes):
+                source = BytesIO(source)
+            rl_img = RLImage(source, width=width, height=height)
             row.append(rl_img)
 
             if len(row) == cols:
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+LAYERS = ("ocr", "items", "images", "pdfs")
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(*parts) -> str:
+    """
+    Stable key for any mix of strings and JSON-serialisable values; dict
+    ordering in the payload does not change the key.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, str):
+            part = json.dumps(part, sort_keys=True, separators=(",", ":"), default=str)
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed cache with one directory per layer. Entries
+    are touched on every hit, and the least recently used ones are evicted
+    once the cache grows past max_bytes.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, enabled: bool = True):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {layer: {"hits": 0, "misses": 0, "writes": 0} for layer in LAYERS}
+        self._total_bytes = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            root=Path(os.getenv("RESULT_CACHE_DIR", "cache")),
+            max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(2 * 1024 ** 3))),
+            enabled=os.getenv("RESULT_CACHE_ENABLED", "true").lower() != "false",
+        )
+
+    def _path(self, layer: str, key: str) -> Path:
+        return self.root / layer / key[:2] / key
+
+    def get(self, layer: str, key: str) -> bytes | None:
+        if not self.enabled:
+            return None
+        path = self._path(layer, key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            data = None
+        with self._lock:
+            self._counters[layer]["hits" if data is not None else "misses"] += 1
+        return data
+
+    def put(self, layer: str, key: str, data: bytes):
+        if not self.enabled:
+            return
+        path = self._path(layer, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._counters[layer]["writes"] += 1
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(data) - old_size
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self._evict()
+
+    def get_json(self, layer: str, key: str):
+        data = self.get(layer, key)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, layer: str, key: str, value):
+        self.put(layer, key, json.dumps(value).encode("utf-8"))
+
+    def read_only(self) -> "ReadOnlyCache":
+        return ReadOnlyCache(self)
+
+    def _entries(self):
+        for layer in LAYERS:
+            layer_dir = self.root / layer
+            if layer_dir.exists():
+                yield from (p for p in layer_dir.rglob("*") if p.is_file() and p.suffix != ".tmp")
+
+    def _scan_size(self) -> int:
+        return sum(p.stat().st_size for p in self._entries())
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for p in self._entries():
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            entries.sort()
+
+            total = sum(size for _, size, _ in entries)
+            # Evict down to 90% so a burst of writes doesn't rescan every time
+            target = int(self.max_bytes * 0.9)
+            for _, size, p in entries:
+                if total <= target:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+            self._total_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "layers": {layer: dict(c) for layer, c in self._counters.items()},
+            }
+
+
+class ReadOnlyCache:
+    """Serves hits from a ResultCache but drops every write."""
+
+    def __init__(self, cache: ResultCache):
+        self._cache = cache
+        self.enabled = cache.enabled
+
+    def get(self, layer: str, key: str) -> bytes | None:
+        return self._cache.get(layer, key)
+
+    def get_json(self, layer: str, key: str):
+        return self._cache.get_json(layer, key)
+
+    def put(self, layer: str, key: str, data: bytes):
+        pass
+
+    def put_json(self, layer: str, key: str, value):
+        pass
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+_cache: ResultCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache.from_env()
+        return _cache
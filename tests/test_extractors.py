@@ -0,0 +1,101 @@
+"""Both extractors on synthetic contracts, native and scanned."""
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("PIL")
+
+import pdf_analysis  # noqa: E402
+from benchmarks.synthetic import SCOPE_ITEMS, make_contract  # noqa: E402
+from pdf_analysis import PdfAnalysis, native_lines  # noqa: E402
+from pdf_images import extract_inspection_images  # noqa: E402
+from pdf_line_items import extract_preferred_package_items  # noqa: E402
+
+PAGES = 20
+SEED = 7
+
+
+@pytest.fixture(scope="module")
+def contracts(tmp_path_factory):
+    root = tmp_path_factory.mktemp("contracts")
+    native, scanned = str(root / "native.pdf"), str(root / "scanned.pdf")
+    info = make_contract(native, PAGES, seed=SEED)
+    make_contract(scanned, PAGES, seed=SEED, scanned=True)
+    return {"native": native, "scanned": scanned, "info": info}
+
+
+@pytest.fixture
+def ocr(contracts, monkeypatch):
+    """
+    Stands in for Tesseract, which isn't needed to test the section logic:
+    "OCR" of a page returns the native text of the same page in the native
+    contract. Records which pages were OCR'd in full and which by band.
+    """
+    monkeypatch.setenv("OCR_WORKERS", "1")
+    monkeypatch.setenv("PAGE_INDEX_ENABLED", "false")
+    monkeypatch.setattr(pdf_analysis, "OCR_ADAPTIVE", False)
+    source = fitz.open(contracts["native"])
+    calls = {"full": set(), "heading": set()}
+
+    def ocr_lines(page, dpi=150):
+        calls["full"].add(page.number)
+        return native_lines(source[page.number])
+
+    def heading_ocr_lines(page, dpi=pdf_analysis.HEADING_DPI, band=pdf_analysis.HEADING_BAND):
+        calls["heading"].add(page.number)
+        ref = source[page.number]
+        clip = fitz.Rect(ref.rect.x0, ref.rect.y0, ref.rect.x1, ref.rect.y0 + ref.rect.height * band)
+        return pdf_analysis._normalize_lines(ref.get_text("text", clip=clip, sort=True).upper())
+
+    monkeypatch.setattr(pdf_analysis, "ocr_lines", ocr_lines)
+    monkeypatch.setattr(pdf_analysis, "heading_ocr_lines", heading_ocr_lines)
+    yield calls
+    source.close()
+
+
+def _extract(path: str):
+    with PdfAnalysis(path) as analysis:
+        items, total = extract_preferred_package_items(path, analysis=analysis)
+        spool = extract_inspection_images(path, analysis=analysis, image_mode="embedded")
+        try:
+            photo_pages = [entry["page"] for entry in spool]
+        finally:
+            spool.close()
+    return items, total, photo_pages
+
+
+@pytest.mark.parametrize("kind", ["native", "scanned"])
+def test_extractors_find_sections_total_and_photos(contracts, ocr, kind):
+    info = contracts["info"]
+
+    items, total, photo_pages = _extract(contracts[kind])
+
+    # The synthetic layout puts title and description on separate lines,
+    # which the parser may read as separate items; either way every line
+    # must come from the section and every chosen item must be there
+    scope_lines = {line for item in SCOPE_ITEMS for line in item}
+    descriptions = [item["description"] for item in items]
+    assert all(any(d.startswith(line) for line in scope_lines) for d in descriptions)
+    found = [title for title, _ in SCOPE_ITEMS if any(d.startswith(title) for d in descriptions)]
+    assert len(found) == info["line_items"]
+    assert total == info["total"]
+    # Page numbers here are 1-based, like the ones the extractor reports
+    assert sorted(set(photo_pages)) == info["inspection_pages"]
+    # Native pages give up their embedded photos; a scanned page is one image
+    per_page = 2 if kind == "native" else 1
+    assert len(photo_pages) == per_page * len(info["inspection_pages"])
+
+
+@pytest.mark.parametrize("kind", ["native", "scanned"])
+def test_pages_past_the_sections_are_never_fully_ocrd(contracts, ocr, kind):
+    info = contracts["info"]
+
+    _extract(contracts[kind])
+
+    section_pages = {p - 1 for p in info["inspection_pages"] + info["preferred_package_pages"]}
+    assert ocr["full"] <= section_pages
+    # The authorization page ends the Preferred Package; nothing after it
+    # needs more than the heading band
+    authorization = max(section_pages) + 1
+    assert not {i for i in ocr["full"] if i >= authorization}
+    if kind == "scanned":
+        assert ocr["full"] == section_pages
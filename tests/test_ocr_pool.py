@@ -0,0 +1,56 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import ocr_pool
+
+
+@pytest.fixture
+def two_workers(monkeypatch):
+    monkeypatch.setattr(ocr_pool, "pool_size", lambda: 2)
+    yield
+    ocr_pool.shutdown_pool()
+
+
+def test_broken_pool_is_replaced(two_workers):
+    pool = ocr_pool.get_pool()
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result(timeout=60)
+
+    replacement = ocr_pool.get_pool()
+    assert replacement is not pool
+    assert replacement.submit(abs, -3).result(timeout=60) == 3
+
+
+def test_cgroup_quota_caps_available_cpus(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(16)), raising=False)
+    monkeypatch.setattr(ocr_pool, "_cgroup_cpu_quota", lambda: 1.5)
+
+    assert ocr_pool.available_cpus() == 2
+
+
+def test_worker_reopens_a_replaced_file(tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    import pdf_analysis
+
+    monkeypatch.setattr(pdf_analysis, "_timed_ocr", lambda page, mode, dpi: (page.get_text().split(), 0.0, []))
+    path = tmp_path / "signed.pdf"
+
+    def write(text: str):
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), text)
+        doc.save(path)
+        doc.close()
+
+    write("FIRST")
+    first_id = pdf_analysis.file_identity(str(path))
+    assert pdf_analysis.ocr_page_worker(first_id, 0, "full", 150)[0] == ["FIRST"]
+
+    write("SECOND CONTRACT")
+    os.utime(path, ns=(first_id[1] + 1_000_000, first_id[1] + 1_000_000))
+    second_id = pdf_analysis.file_identity(str(path))
+    assert pdf_analysis.ocr_page_worker(second_id, 0, "full", 150)[0] == ["SECOND", "CONTRACT"]
+
+    with pytest.raises(RuntimeError):
+        pdf_analysis.ocr_page_worker(first_id, 0, "full", 150)
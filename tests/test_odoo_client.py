@@ -0,0 +1,186 @@
+"""OdooClient against mock_odoo served on a local port."""
+import threading
+
+import pytest
+
+pytest.importorskip("flask")
+requests = pytest.importorskip("requests")
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import mock_odoo  # noqa: E402
+import odoo_client  # noqa: E402
+from odoo_client import OdooClient, OdooConfig, get_client, leased_client  # noqa: E402
+
+PDF_A = b"%PDF-1.4 quantity " + b"a" * 4096
+PDF_B = b"%PDF-1.4 price " + b"b" * 4096
+
+
+@pytest.fixture
+def odoo_url(monkeypatch):
+    server = make_server("127.0.0.1", 0, mock_odoo.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    for key, value in {
+        "ODOO_URL": url,
+        "ODOO_DB": "test",
+        "ODOO_USERNAME": "test",
+        "ODOO_PASSWORD": "test",
+        "ODOO_BACKOFF_BASE": "0.01",
+        "ODOO_BACKOFF_CAP": "0.05",
+    }.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.delenv("ODOO_UPDATE_IN_PLACE", raising=False)
+    monkeypatch.delenv("ODOO_SKIP_UNCHANGED", raising=False)
+    requests.post(f"{url}/mock/reset", timeout=5)
+    requests.post(f"{url}/mock/faults", json={"fail_next": 0, "lose_next_create": 0}, timeout=5)
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture
+def client(odoo_url):
+    client = OdooClient(OdooConfig.from_env())
+    yield client
+    client.close()
+
+
+def _state(url: str) -> dict:
+    return requests.get(f"{url}/mock/state", timeout=5).json()
+
+
+def _upload(client: OdooClient, quantity: bytes = PDF_A, price: bytes = PDF_B, scope: str | None = "c1"):
+    return client.upload_files(
+        {"quantity": ("roof_scope_quantity.pdf", quantity), "price": ("roof_scope_price.pdf", price)},
+        scope=scope,
+    )
+
+
+def test_reauthenticates_once_after_session_expiry(client, odoo_url):
+    client.authenticate()
+    requests.post(f"{odoo_url}/mock/faults", json={"expire_sessions": True}, timeout=5)
+
+    assert client.call_kw("ir.attachment", "search_read", [[]], {"fields": ["id"]}) == []
+    assert client.stats()["reauthentications"] == 1
+
+
+def test_retries_transient_failures(client, odoo_url):
+    client.authenticate()
+    requests.post(f"{odoo_url}/mock/faults", json={"fail_next": 2}, timeout=5)
+
+    outcomes = _upload(client, scope=None)
+
+    assert {o.action for o in outcomes.values()} == {"created"}
+    assert client.stats()["retries"] == 2
+
+
+def test_gives_up_after_max_attempts(client, odoo_url):
+    client.authenticate()
+    requests.post(f"{odoo_url}/mock/faults", json={"fail_next": client.max_attempts}, timeout=5)
+
+    with pytest.raises(odoo_client.OdooError):
+        client.call_kw("ir.attachment", "search_read", [[]])
+
+
+def test_create_is_not_resent_after_a_lost_reply(client, odoo_url):
+    client.authenticate()
+    requests.post(f"{odoo_url}/mock/faults", json={"lose_next_create": 1}, timeout=5)
+
+    with pytest.raises(odoo_client.OdooError) as raised:
+        _upload(client, scope=None)
+
+    assert raised.value.maybe_applied
+    assert len(_state(odoo_url)["attachments"]) == 2
+    assert client.stats()["retries"] == 0
+
+
+def test_scoped_create_after_a_lost_reply_finds_what_arrived(client, odoo_url):
+    first = _upload(client, scope="c1")
+    requests.post(f"{odoo_url}/mock/faults", json={"lose_next_create": 1}, timeout=5)
+
+    outcomes = _upload(client, quantity=PDF_A, price=PDF_B, scope="c2")
+
+    assert {o.action for o in outcomes.values()} == {"created"}
+    attachments = _state(odoo_url)["attachments"]
+    assert len(attachments) == 4
+    c2 = {a["id"] for a in attachments if a["description"] == "contract:c2"}
+    assert {o.attachment_id for o in outcomes.values()} == c2
+    assert not c2 & {o.attachment_id for o in first.values()}
+
+
+def test_both_files_are_created_in_one_call(client, odoo_url):
+    before = _state(odoo_url)["call_kw"]
+
+    outcomes = _upload(client)
+
+    state = _state(odoo_url)
+    # One search_read for the contract's existing files, one create for both
+    assert state["call_kw"] - before == 2
+    assert sorted(a["name"] for a in state["attachments"]) == ["roof_scope_price.pdf", "roof_scope_quantity.pdf"]
+    assert {a["description"] for a in state["attachments"]} == {"contract:c1"}
+    assert outcomes["quantity"].attachment_id != outcomes["price"].attachment_id
+
+
+def test_unchanged_files_are_skipped(client, odoo_url):
+    first = _upload(client)
+    second = _upload(client)
+
+    assert {o.action for o in second.values()} == {"unchanged"}
+    assert second["quantity"].attachment_id == first["quantity"].attachment_id
+    assert len(_state(odoo_url)["attachments"]) == 2
+    assert client.stats()["skipped_bytes"] == len(PDF_A) + len(PDF_B)
+
+
+def test_changed_file_is_updated_in_place_by_default(client, odoo_url):
+    first = _upload(client)
+    second = _upload(client, quantity=PDF_A + b"changed")
+
+    assert second["quantity"].action == "updated"
+    assert second["quantity"].attachment_id == first["quantity"].attachment_id
+    assert second["price"].action == "unchanged"
+    attachments = {a["id"]: a for a in _state(odoo_url)["attachments"]}
+    assert len(attachments) == 2
+    assert attachments[first["quantity"].attachment_id]["file_size"] == len(PDF_A) + len(b"changed")
+
+
+def test_changed_file_is_uploaded_alongside_when_disabled(odoo_url, monkeypatch):
+    monkeypatch.setenv("ODOO_UPDATE_IN_PLACE", "false")
+    client = OdooClient(OdooConfig.from_env())
+    try:
+        first = _upload(client)
+        second = _upload(client, quantity=PDF_A + b"changed")
+    finally:
+        client.close()
+
+    assert second["quantity"].action == "created"
+    assert second["quantity"].attachment_id != first["quantity"].attachment_id
+    assert len(_state(odoo_url)["attachments"]) == 3
+
+
+def test_other_contracts_files_are_never_matched(client, odoo_url):
+    _upload(client, scope="c1")
+    other = _upload(client, scope="c2")
+
+    assert {o.action for o in other.values()} == {"created"}
+    assert len(_state(odoo_url)["attachments"]) == 4
+
+
+def test_uploads_without_scope_never_dedupe(client, odoo_url):
+    _upload(client, scope=None)
+    again = _upload(client, scope=None)
+
+    assert {o.action for o in again.values()} == {"created"}
+
+
+def test_leased_client_outlives_a_config_change(odoo_url, monkeypatch):
+    monkeypatch.setattr(odoo_client, "_client", None)
+    with leased_client() as leased:
+        monkeypatch.setenv("ODOO_DB", "other")
+        replacement = get_client()
+        assert replacement is not leased
+        # Still open for the upload that holds it
+        assert {o.action for o in _upload(leased).values()} == {"created"}
+    assert leased._executor._shutdown
+    assert not replacement._executor._shutdown
+    replacement.close()
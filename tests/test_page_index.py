@@ -0,0 +1,63 @@
+"""page_fingerprint and PageIndex on small generated PDFs."""
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from page_index import PageIndex, page_fingerprint  # noqa: E402
+
+
+def _text_pdf(text: str):
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((72, 72), text, fontsize=12)
+    return doc
+
+
+def _form_pages(*texts: str):
+    # Each page only draws a form XObject placed by show_pdf_page, so the
+    # pages' own content streams are identical
+    doc = fitz.open()
+    for text in texts:
+        src = _text_pdf(text)
+        page = doc.new_page(width=612, height=792)
+        page.show_pdf_page(page.rect, src, 0)
+        src.close()
+    return doc
+
+
+def test_pages_sharing_a_form_name_with_different_content_differ():
+    doc = _form_pages("TOTAL $1,000.00", "TOTAL $9,999.00")
+    first, second = doc[0], doc[1]
+    assert first.read_contents() == second.read_contents()
+
+    assert page_fingerprint(doc, first) != page_fingerprint(doc, second)
+
+
+def test_pages_with_the_same_form_content_match():
+    doc = _form_pages("TERMS AND CONDITIONS", "TERMS AND CONDITIONS")
+
+    assert page_fingerprint(doc, doc[0]) == page_fingerprint(doc, doc[1])
+
+
+def test_pages_with_form_fields_are_not_fingerprinted():
+    doc = _text_pdf("Signature")
+    widget = fitz.Widget()
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.field_name = "signature"
+    widget.rect = fitz.Rect(72, 100, 300, 130)
+    doc[0].add_widget(widget)
+
+    assert page_fingerprint(doc, doc[0]) is None
+
+
+def test_index_trims_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(PageIndex, "TRIM_INTERVAL", 1)
+    index = PageIndex(tmp_path / "index.sqlite3", max_entries=2)
+    index.store("a", "full", "s", ["a"])
+    index.store("b", "full", "s", ["b"])
+    index.lookup("a", "full", "s")
+    index.store("c", "full", "s", ["c"])
+
+    assert index.lookup("a", "full", "s") == ["a"]
+    assert index.lookup("b", "full", "s") is None
+    assert index.lookup("c", "full", "s") == ["c"]
@@ -0,0 +1,55 @@
+from io import BytesIO
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+Image = pytest.importorskip("PIL.Image")
+
+from pdf_analysis import SECTION_HEADINGS, _native_usable, native_lines  # noqa: E402
+
+
+def _jpeg() -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (850, 1100), "white").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _usable(page) -> bool:
+    return _native_usable(page, native_lines(page), SECTION_HEADINGS)
+
+
+def test_scan_with_a_stamped_header_is_not_native():
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(page.rect, stream=_jpeg())
+    page.insert_text((36, 20), "DocuSign Envelope ID: 3F2A9C1E-7B44-4D0A-9E61-2C5B8D7F0A13", fontsize=8)
+
+    assert not _usable(page)
+
+
+def test_text_page_with_a_small_photo_is_native():
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(fitz.Rect(400, 600, 560, 720), stream=_jpeg())
+    page.insert_text((72, 72), "Gutter cleaning and downspout flush, all elevations", fontsize=11)
+
+    assert _usable(page)
+
+
+def test_photo_page_with_a_caption_is_native():
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((72, 72), "Photo set 1: north slope, granule loss and lifted tabs", fontsize=10)
+    page.insert_image(fitz.Rect(36, 90, 576, 430), stream=_jpeg(), keep_proportion=False)
+    page.insert_image(fitz.Rect(36, 440, 576, 780), stream=_jpeg(), keep_proportion=False)
+
+    assert _usable(page)
+
+
+def test_heading_page_over_a_scan_is_still_a_scan():
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_image(page.rect, stream=_jpeg())
+    page.insert_text((72, 72), "INSPECTION", fontsize=14)
+
+    assert not _usable(page)
@@ -0,0 +1,36 @@
+from io import BytesIO
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+Image = pytest.importorskip("PIL.Image")
+
+from pdf_images import _embedded_photos  # noqa: E402
+
+
+def _jpeg(color) -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (400, 300), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_only_images_the_page_draws_are_extracted():
+    doc = fitz.open()
+    first = doc.new_page()
+    first.insert_image(fitz.Rect(50, 50, 450, 350), stream=_jpeg("red"))
+    first.insert_image(fitz.Rect(50, 400, 450, 700), stream=_jpeg("blue"))
+    resources = doc.xref_get_key(first.xref, "Resources")[1]
+    name = first.get_images(full=True)[0][7]
+
+    # A second page sharing the first one's resources but drawing one image
+    second_xref = doc.new_page().xref
+    contents = doc.get_new_xref()
+    doc.update_object(contents, "<<>>")
+    doc.update_stream(contents, f"q 400 0 0 300 50 50 cm /{name} Do Q".encode("ascii"))
+    doc.xref_set_key(second_xref, "Resources", resources)
+    doc.xref_set_key(second_xref, "Contents", f"{contents} 0 R")
+    doc = fitz.open("pdf", doc.tobytes())
+
+    assert len(doc[1].get_images(full=True)) == 2
+    assert len(list(_embedded_photos(doc, doc[1]))) == 1
+    assert len(list(_embedded_photos(doc, doc[0]))) == 2
@@ -0,0 +1,25 @@
+import gc
+import sys
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from raster import pixmap_to_image, render_page  # noqa: E402
+
+
+def test_image_outlives_its_pixmap(monkeypatch):
+    unraisable = []
+    monkeypatch.setattr(sys, "unraisablehook", unraisable.append)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "TERMS AND CONDITIONS", fontsize=24)
+
+    pix = render_page(page, 72, gray=True)
+    expected = bytes(pix.samples)
+    img = pixmap_to_image(pix)
+    del pix
+    gc.collect()
+
+    assert unraisable == []
+    assert img.tobytes() == expected